@@ -1,6 +1,6 @@
 import json
 
-from robyn import Robyn, ALLOW_CORS
+from robyn import Robyn, ALLOW_CORS, Response, Headers
 
 from bluePrints.course import courseRouter
 from bluePrints.department import deptRouter
@@ -8,6 +8,11 @@ from bluePrints.dorm import dormRouter
 from bluePrints.extra import extraRouter
 from bluePrints.user import userRouter
 from models import Session, User
+from utils.audit import startAudit, drainAudit
+from utils.metrics import renderPrometheus
+from utils.passwords import startPasswordPool
+from utils.retention import startRetention
+import utils.slowlog  # 注册慢查询日志
 
 app = Robyn(__file__)
 # 生产环境需要注释：使用nginx解决跨域
@@ -21,11 +26,33 @@ app.include_router(courseRouter)
 app.include_router(dormRouter)
 
 
+# 服务启动：后台定时清理过期日志和导出文件、缓冲写入操作日志、拉起密码计算进程池（Robyn 只保留最后注册的启动函数，统一在此启动）
+async def startup():
+    await startRetention()
+    await startAudit()
+    startPasswordPool()
+
+
+app.startup_handler(startup)
+# 服务关闭前写出缓冲中的操作日志
+app.shutdown_handler(drainAudit)
+
+
 @app.get("/")
 async def index():
     return "Welcome to YOGA CRM"
 
 
+# 各接口耗时、SQL条数等指标（Prometheus文本格式）
+@app.get("/metrics")
+async def metrics():
+    return Response(
+        status_code=200,
+        headers=Headers({"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}),
+        description=renderPrometheus(),
+    )
+
+
 # @app.get("/importClues")
 # async def importClues():
 #     import pandas as pd
@@ -0,0 +1,66 @@
+# 并发压测：一组客户端持续请求慢接口，另一组请求快接口，统计两者吞吐量及快接口的延迟分位数
+# 用于对比处理函数在线程池中执行（默认）与在事件循环中直接执行（config.DB_THREADS = 0）时的表现：
+#   python app.py                        # 另开终端启动服务
+#   python benchmarks/concurrentLoad.py --sessionid <登录后的sessionid> \
+#       --slow /dept/calcSchoolBudget --slow-body '{"schoolId": 1, "startDate": "2020-01-01", "endDate": "2030-01-01"}'
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _request(url, body, sessionid):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method="POST" if data is not None else "GET",
+                                 headers={"Content-Type": "application/json", "sessionid": sessionid or ""})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+
+def _worker(url, body, sessionid, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        try:
+            latencies.append(_request(url, body, sessionid))
+        except Exception:
+            errors.append(1)
+
+
+def _quantile(values, q):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(args):
+    slowBody = json.loads(args.slow_body) if args.slow_body else {}
+    fastBody = json.loads(args.fast_body) if args.fast_body else None
+    deadline = time.perf_counter() + args.duration
+    groups = {"slow": ([], [], args.slow_concurrency, args.url + args.slow, slowBody),
+              "fast": ([], [], args.fast_concurrency, args.url + args.fast, fastBody)}
+    with ThreadPoolExecutor(max_workers=args.slow_concurrency + args.fast_concurrency) as pool:
+        for latencies, errors, concurrency, url, body in groups.values():
+            for _ in range(concurrency):
+                pool.submit(_worker, url, body, args.sessionid, deadline, latencies, errors)
+    for name, (latencies, errors, concurrency, url, _) in groups.items():
+        print(f"{name:5s} {url}  并发{concurrency}  完成{len(latencies)}次  失败{len(errors)}次  "
+              f"吞吐 {len(latencies) / args.duration:.1f} req/s  "
+              f"p50 {_quantile(latencies, 0.5) * 1000:.1f}ms  p95 {_quantile(latencies, 0.95) * 1000:.1f}ms  "
+              f"p99 {_quantile(latencies, 0.99) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--sessionid", default="")
+    parser.add_argument("--slow", default="/dept/calcSchoolBudget")
+    parser.add_argument("--slow-body", default="")
+    parser.add_argument("--fast", default="/")
+    parser.add_argument("--fast-body", default="")
+    parser.add_argument("--slow-concurrency", type=int, default=16)
+    parser.add_argument("--fast-concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20)
+    run(parser.parse_args())
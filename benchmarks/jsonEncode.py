@@ -0,0 +1,55 @@
+# 响应编码微基准：对比 robyn.jsonify（orjson 编码后解码为 str，Robyn 再编码回 bytes）与 utils.encoder 中各编码器直接输出 bytes
+# 数据为 Client._build_json 生成的线索分页（含 datetime、date、列表字段），不访问数据库：
+#   python benchmarks/jsonEncode.py
+import argparse
+import os
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from robyn import jsonify as robynJsonify
+
+from models import Client
+from utils.encoder import ENCODERS
+
+
+def clientPage(size):
+    base = datetime(2025, 1, 1, 8, 30)
+    page = []
+    for i in range(size):
+        client = Client(id=i + 1, name=f"客户{i}", fromSource=i % 5, gender=i % 2, age=20 + i % 30,
+                        IDNumber=f"1101011990{i:08d}", phone=f"138{i:08d}", weixin=f"wx{i}", address="北京市朝阳区",
+                        clientStatus=1 + i % 4, affiliatedUserId=1 + i % 20, creatorId=1 + i % 20,
+                        createdTime=base + timedelta(minutes=i), toClientTime=base + timedelta(days=1, minutes=i),
+                        appointerId=1 + i % 20, courseIds=[1, 2], comboId=None, lessonIds=[3], graduatedLessonIds=[],
+                        processStatus=1 + i % 2, appointDate=date(2025, 2, 1) + timedelta(days=i % 60),
+                        nextTalkDate=date(2025, 3, 1), cooperateTime=base + timedelta(days=3), learnedWeeks=2.5,
+                        bedId=i % 50 or None, bedCheckInDate=date(2025, 3, 1), bedCheckOutDate=date(2025, 6, 1),
+                        info=["意向强烈", "", "周末可约"])
+        page.append(client._build_json("老师甲", "老师乙", 1, "北京", "瑜伽A，瑜伽B", "老师丙", None))
+    return {"status": 200, "clients": page, "total": size}
+
+
+def run(args):
+    candidates = {
+        # 原先的路径：jsonify 得到 str，Robyn 发送前再编码为 bytes
+        "robyn.jsonify": lambda payload: robynJsonify(payload).encode("utf-8"),
+        **{f"encoder {name}": dumps for name, dumps in ENCODERS.items()},
+    }
+    for size in args.sizes:
+        payload = clientPage(size)
+        number = max(1, args.rows // size)
+        print(f"{size} 条/页，每种编码器执行 {number} 次，取 {args.repeat} 轮最优：")
+        for name, func in candidates.items():
+            best = min(timeit.repeat(lambda: func(payload), number=number, repeat=args.repeat)) / number
+            print(f"  {name:15s} {best * 1000:8.2f} ms/页  {size / best:12.0f} 条/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    run(parser.parse_args())
@@ -0,0 +1,25 @@
+# 登录高峰压测：一组客户端持续登录，另一组请求其他接口，统计登录吞吐量及其他接口的延迟分位数
+# 用于对比密码计算在独立进程池中执行（默认）与在请求线程中直接计算（config.PASSWORD_WORKERS = 0）时的表现：
+#   python app.py                        # 另开终端启动服务
+#   python benchmarks/loginStorm.py --username admin --password 12345 --sessionid <登录后的sessionid>
+import argparse
+import json
+
+from concurrentLoad import run
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--sessionid", default="")
+    parser.add_argument("--fast", default="/user/loginCheck")
+    parser.add_argument("--fast-body", default="{}")
+    parser.add_argument("--login-concurrency", type=int, default=32)
+    parser.add_argument("--fast-concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+    args.slow = "/user/login"
+    args.slow_body = json.dumps({"username": args.username, "password": args.password})
+    args.slow_concurrency = args.login_concurrency
+    run(args)
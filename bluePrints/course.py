@@ -1,11 +1,14 @@
 import json
 from datetime import date, datetime
 from dateutil import parser
-from robyn import SubRouter, jsonify
-from sqlalchemy import or_
+from sqlalchemy import select
 
 from models import *
-from utils.hooks import calcSignature, encode, checkSessionid, checkUserAuthority, checkUserVisibleClient
+from utils.audit import addLog, addClientLog
+from utils.encoder import jsonify
+from utils.etag import paramsKey, referenceResponse, versionedResponse
+from utils.hooks import calcSignature, encode, checkSessionid, checkUserAuthority, clientVisibleFilter
+from utils.router import SubRouter
 
 courseRouter = SubRouter(__file__, prefix="/course")
 
@@ -26,7 +29,8 @@ async def getCourses(request):
     pageSize = data.get("pageSize", 10000)
 
     schoolId = data.get("schoolId")
-    try:
+
+    def load():
         if schoolId:
             query = session.query(Course).filter(Course.schoolId == schoolId)
         else:
@@ -45,6 +49,11 @@ async def getCourses(request):
             "courses": [Course.to_json(course) for course in courses],
             "total": total
         })
+
+    try:
+        # 课程信息中含创建人、校区名称
+        return referenceResponse(request, ("getCourses", schoolId, pageIndex, pageSize),
+                                 ["course", "user", "school"], load)
     except Exception as e:
         return jsonify({
             "status": 500,
@@ -131,11 +140,7 @@ async def addCourse(request):
             createdTime=datetime.now()
         )
         session.add(new_course)
-        log = Log(
-            operatorId=userId,
-            operation=f"添加课程：{data['name']}"
-        )
-        session.add(log)
+        addLog(session, userId, f"添加课程：{data['name']}")
         session.commit()
 
         return jsonify({
@@ -212,11 +217,7 @@ async def updateCourse(request):
                     setattr(course, field, data[field])
                 except Exception:
                     continue
-        log = Log(
-            operatorId=userId,
-            operation=f"更新课程：{course.name}"
-        )
-        session.add(log)
+        addLog(session, userId, f"更新课程：{course.name}")
         session.commit()
         return jsonify({
             "status": 200,
@@ -268,11 +269,7 @@ async def deleteCourse(request):
 
         # 删除课程
         session.delete(course)
-        log = Log(
-            operatorId=userId,
-            operation=f"删除课程：{course.name}"
-        )
-        session.add(log)
+        addLog(session, userId, f"删除课程：{course.name}")
         session.commit()
 
         return jsonify({
@@ -309,21 +306,26 @@ async def getAllCombos(request):
         # 计算分页
         offset = (int(pageIndex) - 1) * int(pageSize)
 
-        if schoolId:
-            query = session.query(CourseCombo).filter(CourseCombo.schoolId == schoolId)
-        else:
-            query = session.query(CourseCombo)
-        # 获取总数
-        total = query.count()
+        def load():
+            if schoolId:
+                query = session.query(CourseCombo).filter(CourseCombo.schoolId == schoolId)
+            else:
+                query = session.query(CourseCombo)
+            # 获取总数
+            total = query.count()
 
-        # 获取分页数据
-        combos = query.offset(offset).limit(pageSize).all()
+            # 获取分页数据
+            combos = query.offset(offset).limit(pageSize).all()
 
-        return jsonify({
-            "status": 200,
-            "combos": [combo.to_json() for combo in combos],
-            "total": total
-        })
+            return jsonify({
+                "status": 200,
+                "combos": [combo.to_json() for combo in combos],
+                "total": total
+            })
+
+        # 套餐信息中含校区、课程名称
+        return referenceResponse(request, ("getAllCombos", schoolId, pageIndex, pageSize),
+                                 ["course_combo", "school", "course"], load)
     except Exception as e:
         print(e)
         return jsonify({
@@ -367,11 +369,7 @@ async def addCombo(request):
         school_name = school.name if school else "未知校区"
 
         # 记录操作日志
-        log = Log(
-            operatorId=userId,
-            operation=f"新增套餐：{data.get('name')}，所属校区：{school_name}",
-        )
-        session.add(log)
+        addLog(session, userId, f"新增套餐：{data.get('name')}，所属校区：{school_name}")
 
         session.commit()
         return jsonify({
@@ -431,11 +429,7 @@ async def updateCombo(request):
         new_school_name = new_school.name if new_school else "未知校区"
 
         # 记录操作日志
-        log = Log(
-            operatorId=userId,
-            operation=f"更新套餐：{old_name} -> {data.get('name')}，校区：{old_school_name} -> {new_school_name}",
-        )
-        session.add(log)
+        addLog(session, userId, f"更新套餐：{old_name} -> {data.get('name')}，校区：{old_school_name} -> {new_school_name}")
 
         session.commit()
         return jsonify({
@@ -477,11 +471,7 @@ async def deleteCombo(request):
             })
 
         # 记录操作日志
-        log = Log(
-            operatorId=userId,
-            operation=f"删除套餐：{combo.name}"
-        )
-        session.add(log)
+        addLog(session, userId, f"删除套餐：{combo.name}")
 
         # 删除套餐
         session.delete(combo)
@@ -523,18 +513,12 @@ async def getCourseClients(request):
     try:
         courseId = int(courseId)
 
-        # 使用数据库函数直接过滤，提高性能
-        clients_data = []
-        clientsCooperated = session.query(Client).filter(
+        # 通过学员-课程关联表的索引查找
+        clientIds = session.query(Client.id).join(ClientCourse, ClientCourse.clientId == Client.id).filter(
+            ClientCourse.courseId == courseId,
             Client.processStatus == 2  # 已成单
-        ).all()
-
-        for client in clientsCooperated:
-            # 检查课程ID是否在客户的课程列表中
-            if client.courseIds and courseId in client.courseIds:
-                clients_data.append({
-                    "id": client.id,
-                })
+        ).order_by(Client.id)
+        clients_data = [{"id": clientId} for (clientId,) in clientIds]
         return jsonify({
             "status": 200,
             "message": "查询成功",
@@ -582,7 +566,7 @@ async def getLessons(request):
     startDate = data.get("startDate")
     endDate = data.get("endDate")
 
-    try:
+    def load():
         query = session.query(Lesson)
 
         # 添加筛选条件
@@ -621,6 +605,11 @@ async def getLessons(request):
             "lessons": [lesson.to_json() for lesson in lessons],
             "total": total
         })
+
+    try:
+        # 班级信息中含课程、班主任、校区名称
+        return versionedResponse(request, ("getLessons", paramsKey(data)), ["lesson", "course", "user", "school"],
+                                 load)
     except Exception as e:
         return jsonify({
             "status": 500,
@@ -681,18 +670,13 @@ async def getLessonClients(request):
 
     try:
         lessonId = int(lessonId)
-        # 使用数据库函数直接过滤，提高性能
-        clients_data = []
-        clientsCooperated = session.query(Client).filter(
+        # 通过学员-班级关联表的索引查找
+        clientIds = session.query(Client.id).join(ClientLesson, ClientLesson.clientId == Client.id).filter(
+            ClientLesson.lessonId == lessonId,
+            ClientLesson.enrolled == True,
             Client.processStatus == 2  # 已成单
-        ).all()
-
-        for client in clientsCooperated:
-            # 检查课程ID是否在客户的课程列表中
-            if client.lessonIds and lessonId in client.lessonIds:
-                clients_data.append({
-                    "id": client.id,
-                })
+        ).order_by(Client.id)
+        clients_data = [{"id": clientId} for (clientId,) in clientIds]
         return jsonify({
             "status": 200,
             "message": "查询成功",
@@ -735,18 +719,13 @@ async def getLessonGraduatedClients(request):
 
     try:
         lessonId = int(lessonId)
-        # 使用数据库函数直接过滤，提高性能
-        clients_data = []
-        clientsCooperated = session.query(Client).filter(
+        # 通过学员-班级关联表的索引查找
+        clientIds = session.query(Client.id).join(ClientLesson, ClientLesson.clientId == Client.id).filter(
+            ClientLesson.lessonId == lessonId,
+            ClientLesson.graduated == True,
             Client.processStatus == 2  # 已成单
-        ).all()
-
-        for client in clientsCooperated:
-            # 检查课程ID是否在客户的课程列表中
-            if client.graduatedLessonIds and lessonId in client.graduatedLessonIds:
-                clients_data.append({
-                    "id": client.id,
-                })
+        ).order_by(Client.id)
+        clients_data = [{"id": clientId} for (clientId,) in clientIds]
         return jsonify({
             "status": 200,
             "message": "查询成功",
@@ -811,11 +790,7 @@ async def addLesson(request):
             createdTime=datetime.now()  # 添加创建时间
         )
         session.add(new_lesson)
-        log = Log(
-            operatorId=userId,
-            operation=f"添加班级：{data['name']}"
-        )
-        session.add(log)
+        addLog(session, userId, f"添加班级：{data['name']}")
         session.commit()
 
         return jsonify({
@@ -886,11 +861,7 @@ async def updateLesson(request):
                         setattr(lesson, field, data[field])
                 except Exception:
                     continue
-        log = Log(
-            operatorId=userId,
-            operation=f"更新班级：{lesson.name}"
-        )
-        session.add(log)
+        addLog(session, userId, f"更新班级：{lesson.name}")
         session.commit()
         return jsonify({
             "status": 200,
@@ -942,11 +913,7 @@ async def deleteLesson(request):
 
         # 删除班级
         session.delete(lesson)
-        log = Log(
-            operatorId=userId,
-            operation=f"删除班级：{lesson.name}"
-        )
-        session.add(log)
+        addLog(session, userId, f"删除班级：{lesson.name}")
         session.commit()
 
         return jsonify({
@@ -983,35 +950,20 @@ async def getQualifiedStudents(request):
             "message": "参数不完整"
         })
     lessonCourseId = int(lessonCourseId)
-    query = session.query(Client).filter(Client.processStatus == 2,
-                                         Client.courseIds.contains(lessonCourseId))
+    query = session.query(Client).filter(Client.processStatus == 2, Client.id.in_(
+        select(ClientCourse.clientId).where(ClientCourse.courseId == lessonCourseId)))
     # 权限分割
-    tag, schoolId, deptId = checkUserVisibleClient(userId)
-    match tag:
-        case 1:  # 本人相关
-            query = query.filter(
-                or_(Client.affiliatedUserId == userId, Client.creatorId == userId, Client.appointerId == userId))
-        case 2:  # 本校区
-            teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.schoolId == schoolId)]
-            query = query.filter(
-                or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                    Client.appointerId.in_(teacher_ids)))
-        case 3:  # 本部门
-            teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.departmentId == deptId)]
-            query = query.filter(
-                or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                    Client.appointerId.in_(teacher_ids)))
-        case 4:  # 全部
-            pass
-        case _:
-            return jsonify({
-                "status": -2,
-                "message": "未限定范围"
-            })
+    visibleFilter = clientVisibleFilter(userId)
+    if visibleFilter is None:
+        return jsonify({
+            "status": -2,
+            "message": "未限定范围"
+        })
+    query = query.filter(visibleFilter)
     # 获取分页数据
     clients = query.order_by(Client.clientStatus, Client.createdTime.desc()).all()
 
-    clients = [Client.to_json(client) for client in clients]
+    clients = Client.bulk_to_json(clients, session)
     session.close()
     return jsonify({
         "status": 200,
@@ -1076,10 +1028,10 @@ async def addStudent(request):
         if not client.lessonIds:
             client.lessonIds = []
         client.lessonIds.append(lessonId)
+        client.syncEnrollments()
 
         logContent = f"班级：{lesson.name}添加学员"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -1151,9 +1103,9 @@ async def removeStudent(request):
         # 从学员的课程列表中移除该课程
         if client.lessonIds and lessonId in client.lessonIds:
             client.lessonIds.remove(lessonId)
+            client.syncEnrollments()
             logContent = f"课程：{session.query(Lesson).get(lessonId).name}移除学员"
-            clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-            session.add(clientLog)
+            addClientLog(session, client.id, userId, logContent)
             session.commit()
             return jsonify({
                 "status": 200,
@@ -1219,10 +1171,10 @@ async def graduateClient(request):
                 "message": "该学员在该课程已毕业，无法重复操作"
             })
         client.graduatedLessonIds.append(lessonId)
+        client.syncEnrollments()
 
         logContent = f"课程：{session.query(Lesson).get(lessonId).name}毕业"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -1283,10 +1235,10 @@ async def ungraduateClient(request):
                 "message": "该学员尚未毕业，无法取消"
             })
         client.graduatedLessonIds.remove(lessonId)
+        client.syncEnrollments()
 
         logContent = f"课程：{session.query(Lesson).get(lessonId).name}取消毕业"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
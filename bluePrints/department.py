@@ -1,7 +1,11 @@
-from robyn import SubRouter, jsonify
+from sqlalchemy import case, func
 
 from models import *
+from utils.encoder import jsonify
+from utils.etag import referenceResponse
 from utils.hooks import calcSignature, encode, checkSessionid, checkUserAuthority
+from utils.ledger import ledgerBalanceBefore
+from utils.router import SubRouter
 
 deptRouter = SubRouter(__file__, prefix="/dept")
 
@@ -19,16 +23,19 @@ async def getAllDepts(request):
     try:
         data = request.json()
         schoolId = data.get("schoolId")
-        if schoolId:
-            depts = session.query(Department).filter(Department.schoolId == schoolId).all()
-        else:
-            depts = session.query(Department).all()
-        depts = [Department.to_json(dept) for dept in depts]
-        return jsonify({
-            "status": 200,
-            "message": "全部部门获取成功",
-            "depts": depts,
-        })
+
+        def load():
+            if schoolId:
+                depts = session.query(Department).filter(Department.schoolId == schoolId).all()
+            else:
+                depts = session.query(Department).all()
+            return jsonify({
+                "status": 200,
+                "message": "全部部门获取成功",
+                "depts": [Department.to_json(dept) for dept in depts],
+            })
+
+        return referenceResponse(request, ("getAllDepts", schoolId), ["department"], load)
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -78,17 +85,17 @@ async def getAllSchools(request):
     session = Session()
     try:
         data = request.json()
-        schools = session.query(School).all()
-        withNet = data.get("withNet", False)
-        if withNet:
-            schools = [School.to_json(school) for school in schools]
-        else:
-            schools = [School.to_json(school) for school in schools if school.name != "网络部"]
-        return jsonify({
-            "status": 200,
-            "message": "全部校区获取成功",
-            "schools": schools,
-        })
+        withNet = bool(data.get("withNet", False))
+
+        def load():
+            schools = session.query(School).all()
+            return jsonify({
+                "status": 200,
+                "message": "全部校区获取成功",
+                "schools": [School.to_json(school) for school in schools if withNet or school.name != "网络部"],
+            })
+
+        return referenceResponse(request, ("getAllSchools", withNet), ["school"], load)
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -562,18 +569,18 @@ async def calcSchoolBudget(request):
                 "status": 400,
                 "message": "学校不存在"
             })
-        query = session.query(Payment).join(Payment.teacher).filter(
-            User.schoolId == schoolId
-        )
-        paymentsBefore = query.filter(Payment.paymentDate < startDate).all()
-        inDuring = query.filter(Payment.paymentDate >= startDate, Payment.paymentDate <= endDate,
-                                Payment.amount > 0).all()
-        exDuring = query.filter(Payment.paymentDate >= startDate, Payment.paymentDate <= endDate,
-                                Payment.amount < 0).all()
-
-        budgetBefore = sum(payment.amount for payment in paymentsBefore)
-        incomeDuring = sum(payment.amount for payment in inDuring)
-        expanseDuring = sum(payment.amount for payment in exDuring)
+        # 期初余额：读开始日期前最后一天的台账结余
+        budgetBefore = ledgerBalanceBefore(session, schoolId, startDate)
+        # 期间收入、支出：一条 SUM(CASE) 聚合
+        incomeDuring, expanseDuring = session.query(
+            func.coalesce(func.sum(case((Payment.amount > 0, Payment.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((Payment.amount < 0, Payment.amount), else_=0)), 0),
+        ).join(Payment.teacher).filter(
+            User.schoolId == schoolId,
+            Payment.paymentDate >= startDate,
+            Payment.paymentDate <= endDate
+        ).one()
+        incomeDuring, expanseDuring = int(incomeDuring), int(expanseDuring)
         budgetAfter = budgetBefore + incomeDuring + expanseDuring
 
         return jsonify({
@@ -1,9 +1,15 @@
 from dateutil import parser
-from robyn import SubRouter, jsonify
+from sqlalchemy import or_, select
 from sqlalchemy.orm import joinedload
 
 from models import *
+from utils.audit import addLog, addClientLog
+from utils.encoder import jsonify
+from utils.etag import paramsKey, versionedResponse
 from utils.hooks import checkSessionid, checkUserAuthority
+from utils.cache import cachedCount
+from utils.pagination import flagOf
+from utils.router import SubRouter
 
 dormRouter = SubRouter(__file__, prefix="/dorm")
 
@@ -24,26 +30,30 @@ async def getDormInfoByBedId(request):
 
     session = Session()
     try:
-        # 获取床位信息，包括关联的房间和公寓信息
-        bed = session.query(Bed).get(bed_id)
+        # 该床位所在房间的全部床位及入住客户、房间和公寓信息一次查出
+        sameRoom = select(Bed.roomId).where(Bed.id == bed_id).scalar_subquery()
+        roster = Bed.rosterOf(session, or_(Bed.id == bed_id, Bed.roomId == sameRoom), withRoom=True)
+        bed, occupant = next(((bed, occupant) for bed, occupant in roster if str(bed.id) == str(bed_id)),
+                             (None, None))
         if not bed:
             return jsonify({
                 "status": 404,
                 "message": "床位不存在"
             })
 
-        room = session.query(Room).get(bed.roomId)
+        room = bed.room
         if not room:
             return jsonify({
                 "status": 404,
                 "message": "房间不存在"
             })
-        dormitory = session.query(Dormitory).get(room.dormitoryId)
+        dormitory = room.dormitory
+        occupancy = (len(roster), sum(1 for _, client in roster if client))
         return jsonify({
             "status": 200,
-            "dorm": dormitory.to_json(),
-            "room": room.to_json(),
-            "bed": bed.to_json()
+            "dorm": dormitory.to_json(Dormitory.occupancyOf(session, [dormitory.id]).get(dormitory.id, (0, 0, 0))),
+            "room": room.to_json(occupancy),
+            "bed": bed.to_json(occupant)
         })
     except Exception as e:
         session.rollback()
@@ -70,7 +80,8 @@ async def getDormitories(request):
     pageSize = data.get("pageSize", 10)
     schoolId = data.get("schoolId")
     session = Session()
-    try:
+
+    def load():
         # 构建查询
         if schoolId:
             query = session.query(Dormitory).filter(Dormitory.schoolId == schoolId)
@@ -81,19 +92,32 @@ async def getDormitories(request):
         user = session.query(User).get(userId)
         if user.usertype == 1:
             query = session.query(Dormitory).filter(Dormitory.schoolId == user.schoolId)
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
         # 获取总数
-        total = query.count()
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
         # 获取分页数据
-        dormitories = query.order_by(Dormitory.id) \
+        dormitories = query.options(joinedload(Dormitory.school)).order_by(Dormitory.id) \
             .offset((int(pageIndex) - 1) * int(pageSize)) \
             .limit(pageSize) \
             .all()
 
+        # 本页公寓的房间、床位统计一次查出
+        occupancy = Dormitory.occupancyOf(session, [dorm.id for dorm in dormitories])
         return jsonify({
             "status": 200,
-            "dormitories": [dorm.to_json() for dorm in dormitories],
+            "dormitories": [dorm.to_json(occupancy.get(dorm.id, (0, 0, 0))) for dorm in dormitories],
             "total": total
         })
+
+    try:
+        # 可见范围随用户身份变化，key 中带上用户；占用情况来自房间、床位及客户入住信息
+        return versionedResponse(request, ("getDormitories", userId, paramsKey(data)),
+                                 ["dormitory", "school", "room", "bed", "client", "user"], load)
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -258,10 +282,11 @@ async def getRooms(request):
     session = Session()
     try:
         # 获取指定公寓的所有房间
-        rooms = session.query(Room).filter(Room.dormitoryId == dormitoryId).all()
+        rooms = session.query(Room).options(joinedload(Room.dormitory)).filter(Room.dormitoryId == dormitoryId).all()
+        occupancy = Room.occupancyOf(session, [room.id for room in rooms])
         return jsonify({
             "status": 200,
-            "rooms": [room.to_json() for room in rooms]
+            "rooms": [room.to_json(occupancy.get(room.id, (0, 0))) for room in rooms]
         })
     except Exception as e:
         session.rollback()
@@ -422,8 +447,7 @@ async def getBeds(request):
     session = Session()
     try:
         # 获取指定房间的所有床位
-        beds = session.query(Bed).filter(Bed.roomId == roomId).all()
-        beds_json = [bed.to_json() for bed in beds]
+        beds_json = [bed.to_json(occupant) for bed, occupant in Bed.rosterOf(session, Bed.roomId == roomId)]
         return jsonify({
             "status": 200,
             "beds": beds_json
@@ -565,8 +589,7 @@ async def deleteBed(request):
             })
         # 删除床位
         session.delete(bed)
-        log = Log(operatorId=userId, operation="删除床位")
-        session.add(log)
+        addLog(session, userId, "删除床位")
         session.commit()
 
         return jsonify({
@@ -675,11 +698,9 @@ async def assignBed(request):
         student.bedCheckInDate = datetime.now().date()
         student.bedCheckOutDate = checkOutDate
         bed.duration = daysDuration
-        log = Log(operatorId=userId, operation=f"学员：{student.name}入住")
-        session.add(log)
+        addLog(session, userId, f"学员：{student.name}入住")
         logContent = "学员入住宿舍"
-        clientLog = ClientLog(clientId=student.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, student.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -740,11 +761,9 @@ async def checkOut(request):
         bed.duration = 0
 
         # 添加操作日志
-        log = Log(operatorId=userId, operation=f"学员：{student_name}离住")
-        session.add(log)
+        addLog(session, userId, f"学员：{student_name}离住")
         logContent = "学员离住"
-        clientLog = ClientLog(clientId=student.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, student.id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -770,41 +789,57 @@ async def getOverdueBeds(request):
             "status": -1,
             "message": "用户未登录"
         })
+    # 分页等参数均为可选：原有调用方不带请求体，Robyn 解析空请求体时会抛出 ValueError
+    try:
+        data = request.json() or {}
+    except ValueError:
+        data = {}
+    pageIndex = data.get("pageIndex")
+    pageSize = data.get("pageSize", 10)
+    schoolId = data.get("schoolId")
     session = Session()
     try:
         today = datetime.now().date()
-        # 预加载 clients，防止 lazy load
-        beds = session.query(Bed).options(joinedload(Bed.clients)).filter(Bed.clients is not None).all()
-        result = []
-        for bed in beds:
-            if not bed.clients:
-                continue  # 安全检查
-            client = bed.clients[-1]  # 默认取最后入住者
-
-            # 使用离住日期判断是否超期
-            check_out_date = client.bedCheckOutDate
-
-            # 如果没有设置离住日期，则跳过
-            if not check_out_date:
-                continue
-
-            # 如果离住日期在今天之前，则已超期
-            if today > check_out_date:
-                overdue_days = (today - check_out_date).days
-                result.append({
-                    "bedId": bed.id,
-                    "clientId": client.id,
-                    "clientName": client.name,
-                    "dormName": bed.room.dormitory.name,
-                    "roomNumber": bed.room.roomNumber,
-                    "bedNumber": bed.bedNumber,
-                    "bedCheckInDate": client.bedCheckInDate,
-                    "bedCheckOutDate": check_out_date,
-                    "overdueDays": overdue_days
-                })
+        # 离住日期早于今天即为超期，走 bedCheckOutDate 索引
+        query = session.query(
+            Bed.id, Client.id, Client.name, Dormitory.name, Room.roomNumber, Bed.bedNumber,
+            Client.bedCheckInDate, Client.bedCheckOutDate
+        ).join(Client, Client.bedId == Bed.id).join(Room, Bed.roomId == Room.id) \
+            .join(Dormitory, Room.dormitoryId == Dormitory.id).filter(Client.bedCheckOutDate < today)
+
+        # 权限分割
+        user = session.query(User).get(userId)
+        if user.usertype == 1:
+            schoolId = user.schoolId
+        if schoolId:
+            query = query.filter(Dormitory.schoolId == schoolId)
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
+        # 超期最久的排在前面；不带 pageIndex 时与原先一样返回全部
+        query = query.order_by(Client.bedCheckOutDate, Bed.id)
+        if pageIndex:
+            query = query.offset((int(pageIndex) - 1) * int(pageSize)).limit(int(pageSize))
+        rows = query.all()
+        result = [{
+            "bedId": bedId,
+            "clientId": clientId,
+            "clientName": clientName,
+            "dormName": dormName,
+            "roomNumber": roomNumber,
+            "bedNumber": bedNumber,
+            "bedCheckInDate": bedCheckInDate,
+            "bedCheckOutDate": bedCheckOutDate,
+            "overdueDays": (today - bedCheckOutDate).days
+        } for bedId, clientId, clientName, dormName, roomNumber, bedNumber, bedCheckInDate, bedCheckOutDate in rows]
         return jsonify({
             "status": 200,
-            "result": result
+            "result": result,
+            "total": total
         })
     except Exception as e:
         session.rollback()
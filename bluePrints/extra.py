@@ -5,12 +5,22 @@ import oss2
 from dateutil import parser
 import json
 
-from robyn import SubRouter, jsonify
-from sqlalchemy import or_
+from sqlalchemy import or_, select
+from sqlalchemy.orm import aliased
 
 from config import OSS_ACCESS_KEY_ID, OSS_ACCESS_KEY_SECRET, OSS_BUCKET_NAME, OSS_ENDPOINT
 from models import *
-from utils.hooks import calcSignature, encode, checkSessionid, checkUserAuthority, checkUserVisibleClient
+from utils.audit import addLog, addClientLog, addClientLogs
+from utils.encoder import jsonify
+from utils.exporter import EXPORT_BATCH_SIZE, EXPORT_FORMATS, writeExport, exportResponse
+from utils.hooks import calcSignature, encode, checkSessionid, checkUserAuthority, checkUserVisibleClient, \
+    clientVisibleFilter, paymentVisibleFilter
+from utils.cache import cachedCount
+from utils.importer import importClues, submitImport, getImportJob
+from utils.ledger import applyPayment, paymentSummary, SUMMARY_PERIODS, SUMMARY_DIMENSIONS
+from utils.metrics import countRows
+from utils.pagination import keysetPage, flagOf
+from utils.router import SubRouter
 
 # 初始化阿里云OSS Bucket
 auth = oss2.Auth(OSS_ACCESS_KEY_ID, OSS_ACCESS_KEY_SECRET)
@@ -18,6 +28,24 @@ bucket = oss2.Bucket(auth, OSS_ENDPOINT, OSS_BUCKET_NAME)
 
 extraRouter = SubRouter(__file__, prefix="/extra")
 
+# 游标分页的排序键：与页码分页的排序一致，id 兜底保证唯一
+CLUE_CURSOR_KEYS = [(Client.createdTime, True), (Client.clientStatus, False), (Client.id, True)]
+CLIENT_CURSOR_KEYS = [(Client.clientStatus, False), (Client.createdTime, True), (Client.id, True)]
+
+# 客户导出的列：(表头, Client.bulk_to_json 中的字段)
+CLIENT_EXPORT_COLUMNS = [
+    ("ID", "id"), ("姓名", "name"), ("来源", "fromSource"), ("性别", "gender"), ("年龄", "age"),
+    ("身份证", "IDNumber"), ("电话", "phone"), ("微信", "weixin"), ("QQ", "QQ"), ("抖音", "douyin"),
+    ("小红书", "rednote"), ("商务通", "shangwutong"), ("地区", "address"), ("客户状态", "clientStatus"),
+    ("跟进状态", "processStatus"), ("校区", "schoolName"), ("所属老师", "affiliatedUserName"),
+    ("创建人", "creatorName"), ("创建时间", "createdTime"), ("转客户时间", "toClientTime"),
+    ("预约人", "appointerName"), ("预约日期", "appointDate"), ("下次沟通日期", "nextTalkDate"),
+    ("课程", "courseNames"), ("套餐", "comboName"), ("合作时间", "cooperateTime"), ("已学周数", "learnedWeeks"),
+    ("入住日期", "bedCheckInDate"), ("退宿日期", "bedCheckOutDate"), ("备注", "info"),
+]
+PAYMENT_EXPORT_HEADER = ["ID", "交易日期", "金额", "类别", "交易方式", "客户", "客户电话", "收款方", "负责老师", "校区", "备注"]
+LEDGER_EXPORT_HEADER = ["校区", "日期", "收入", "支出", "当日净额", "累计余额"]
+
 
 # 只有客户信息卡调用该接口
 @extraRouter.post("/getClientById")
@@ -102,16 +130,22 @@ async def searchClient(request):
     try:
         # 构建查询
         query = session.query(Client).order_by(Client.createdTime.desc(), Client.clientStatus)
-        query = query.filter(
-            or_(Client.weixin.contains(contact), Client.phone.contains(contact), Client.QQ.contains(contact),
-                Client.douyin.contains(contact), Client.shangwutong.contains(contact)))
+        # 联系方式走 client_contact 表的索引，不再对客户表五个字段做 LIKE 全表扫描
+        matchedIds = ClientContact.matchClientIds(str(contact), session.get_bind().dialect.name)
+        query = query.filter(Client.id.in_(matchedIds))
 
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
         # 获取分页数据
         clients = query.offset(offset).limit(page_size).all()
-        clients = [Client.to_json(client) for client in clients]
+        clients = Client.bulk_to_json(clients, session)
 
         # 获取总数
-        total = query.count()
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
 
         return jsonify({
             "status": 200,
@@ -146,7 +180,7 @@ async def getClueClients(request):
     session = Session()
     # try:
     # 构建查询
-    query = session.query(Client).order_by(Client.createdTime.desc(), Client.clientStatus)
+    query = session.query(Client).order_by(Client.createdTime.desc(), Client.clientStatus, Client.id.desc())
 
     # 添加筛选条件
     if data.get("name"):
@@ -194,41 +228,49 @@ async def getClueClients(request):
             query = query.filter(Client.affiliatedUserId.in_(affiliatedUserId))
 
     # 权限分割
-    tag, schoolId, deptId = checkUserVisibleClient(userId)
-    match tag:
-        case 1:  # 本人相关
-            query = query.filter(
-                or_(Client.affiliatedUserId == userId, Client.creatorId == userId, Client.appointerId == userId))
-        case 2:  # 本校区
-            teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.schoolId == schoolId)]
-            query = query.filter(
-                or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                    Client.appointerId.in_(teacher_ids)))
-        case 3:  # 本部门
-            teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.departmentId == deptId)]
-            query = query.filter(
-                or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                    Client.appointerId.in_(teacher_ids)))
-        case 4:  # 全部
-            pass
-        case _:
+    visibleFilter = clientVisibleFilter(userId)
+    if visibleFilter is None:
+        return jsonify({
+            "status": -2,
+            "message": "未限定范围"
+        })
+    query = query.filter(visibleFilter)
+    # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+    if flagOf(data, "countOnly"):
+        total = cachedCount(query)
+        session.close()
+        return jsonify({
+            "status": 200,
+            "total": total
+        })
+    # 获取分页数据：传入cursor时按游标分页（空串为第一页），否则按页码分页
+    cursor = data.get("cursor")
+    nextCursor = None
+    if cursor is not None:
+        try:
+            clients, nextCursor = keysetPage(query, CLUE_CURSOR_KEYS, cursor, int(page_size))
+        except ValueError as e:
+            session.close()
             return jsonify({
-                "status": -2,
-                "message": "未限定范围"
+                "status": 400,
+                "message": str(e)
             })
-    # 获取分页数据
-    clients = query.offset(offset).limit(page_size).all()
-    clients = [Client.to_json(client) for client in clients]
+    else:
+        clients = query.offset(offset).limit(page_size).all()
+    clients = Client.bulk_to_json(clients, session)
 
     # 获取总数
-    total = query.count()
+    total = None if flagOf(data, "skipTotal") else cachedCount(query)
 
-    return jsonify({
+    res = {
         "status": 200,
         "message": "分页获取成功",
         "clients": clients,
         "total": total
-    })
+    }
+    if cursor is not None:
+        res["nextCursor"] = nextCursor
+    return jsonify(res)
     # except Exception as e:
     #     print(e)
     #     session.rollback()
@@ -239,6 +281,60 @@ async def getClueClients(request):
     #     session.close()
 
 
+# 已转客户、已预约到店的筛选条件（不含可见范围），getClients 与 exportClients 共用
+def clientsQuery(session, data):
+    clientStatus = data.get("clientStatus")
+    if clientStatus == "null":
+        clientStatus = None
+    # 基础查询
+    query = session.query(Client).filter(Client.clientStatus.in_([3, 4])).order_by(Client.clientStatus,
+                                                                                   Client.createdTime.desc(),
+                                                                                   Client.id.desc())
+
+    # 添加筛选条件
+    filters = {
+        'name': lambda x: Client.name.like(f"%{x}%"),
+        'fromSource': lambda x: Client.fromSource == x,
+        'gender': lambda x: Client.gender == x,
+        'age': lambda x: Client.age == x,
+        'IDNumber': lambda x: Client.IDNumber.like(f"%{x}%"),
+        'phone': lambda x: Client.phone.like(f"%{x}%"),
+        'weixin': lambda x: Client.weixin.like(f"%{x}%"),
+        'QQ': lambda x: Client.QQ.like(f"%{x}%"),
+        'douyin': lambda x: Client.douyin.like(f"%{x}%"),
+        'rednote': lambda x: Client.rednote.like(f"%{x}%"),
+        'shangwutong': lambda x: Client.shangwutong.like(f"%{x}%"),
+        'address': lambda x: Client.address.like(f"%{x}%"),
+        'appointerId': lambda x: Client.appointerId == x,
+        'affiliatedUserName': lambda x: Client.affiliatedUser.username.like(f"%{x}%"),
+        # 'appointerName': lambda x: Client.appointerName.like(f"%{x}%"),
+        'processStatus': lambda x: Client.processStatus == x,
+    }
+
+    # 处理校区：由于schoolId是@property属性，不是SQL字段，直接filter不执行
+    if data.get("schoolId"):
+        query = query.join(Client.affiliatedUser).filter(User.schoolId == data["schoolId"])
+
+    # 处理日期范围筛选
+    if data.get('startTime') and data.get('endTime'):
+        query = query.filter(Client.createdTime.between(data['startTime'], data['endTime']))
+
+    if data.get('appointStartDate') and data.get('appointEndDate'):
+        query = query.filter(Client.appointDate.between(data['appointStartDate'], data['appointEndDate']))
+
+    if data.get('nextTalkStartDate') and data.get('nextTalkEndDate'):
+        query = query.filter(Client.nextTalkDate.between(data['nextTalkStartDate'], data['nextTalkEndDate']))
+
+    # 应用其他筛选条件
+    for field, filter_func in filters.items():
+        if data.get(field):
+            query = query.filter(filter_func(data[field]))
+
+    if clientStatus:
+        query = query.filter(Client.clientStatus == clientStatus)
+    return query
+
+
 # 获取已转客户、已预约到店
 @extraRouter.post("/getClients")
 async def getClients(request):
@@ -251,100 +347,114 @@ async def getClients(request):
         })
 
     data = request.json()
-    clientStatus = data.get("clientStatus")
-    if clientStatus == "null":
-        clientStatus = None
     page_index = data.get("pageIndex", 1)
     page_size = data.get("pageSize", 10)
     offset = (int(page_index) - 1) * int(page_size)
     session = Session()
     try:
-        # 基础查询
-        query = session.query(Client).filter(Client.clientStatus.in_([3, 4])).order_by(Client.clientStatus,
-                                                                                       Client.createdTime.desc())
-
-        # 添加筛选条件
-        filters = {
-            'name': lambda x: Client.name.like(f"%{x}%"),
-            'fromSource': lambda x: Client.fromSource == x,
-            'gender': lambda x: Client.gender == x,
-            'age': lambda x: Client.age == x,
-            'IDNumber': lambda x: Client.IDNumber.like(f"%{x}%"),
-            'phone': lambda x: Client.phone.like(f"%{x}%"),
-            'weixin': lambda x: Client.weixin.like(f"%{x}%"),
-            'QQ': lambda x: Client.QQ.like(f"%{x}%"),
-            'douyin': lambda x: Client.douyin.like(f"%{x}%"),
-            'rednote': lambda x: Client.rednote.like(f"%{x}%"),
-            'shangwutong': lambda x: Client.shangwutong.like(f"%{x}%"),
-            'address': lambda x: Client.address.like(f"%{x}%"),
-            'appointerId': lambda x: Client.appointerId == x,
-            'affiliatedUserName': lambda x: Client.affiliatedUser.username.like(f"%{x}%"),
-            # 'appointerName': lambda x: Client.appointerName.like(f"%{x}%"),
-            'processStatus': lambda x: Client.processStatus == x,
-        }
-
-        # 处理校区：由于schoolId是@property属性，不是SQL字段，直接filter不执行
-        if data.get("schoolId"):
-            query = query.join(Client.affiliatedUser).filter(User.schoolId == data["schoolId"])
-
-        # 处理日期范围筛选
-        if data.get('startTime') and data.get('endTime'):
-            query = query.filter(Client.createdTime.between(data['startTime'], data['endTime']))
-
-        if data.get('appointStartDate') and data.get('appointEndDate'):
-            query = query.filter(Client.appointDate.between(data['appointStartDate'], data['appointEndDate']))
-
-        if data.get('nextTalkStartDate') and data.get('nextTalkEndDate'):
-            query = query.filter(Client.nextTalkDate.between(data['nextTalkStartDate'], data['nextTalkEndDate']))
-
-        # 应用其他筛选条件
-        for field, filter_func in filters.items():
-            if data.get(field):
-                query = query.filter(filter_func(data[field]))
-
-        if clientStatus:
-            query = query.filter(Client.clientStatus == clientStatus)
+        query = clientsQuery(session, data)
 
         # 权限分割
-        tag, schoolId, deptId = checkUserVisibleClient(userId)
-        match tag:
-            case 1:  # 本人相关
-                query = query.filter(
-                    or_(Client.affiliatedUserId == userId, Client.creatorId == userId, Client.appointerId == userId))
-            case 2:  # 本校区
-                teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.schoolId == schoolId)]
-                query = query.filter(
-                    or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                        Client.appointerId.in_(teacher_ids)))
-            case 3:  # 本部门
-                teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.departmentId == deptId)]
-                query = query.filter(
-                    or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                        Client.appointerId.in_(teacher_ids)))
-            case 4:  # 全部
-                pass
-            case _:
+        visibleFilter = clientVisibleFilter(userId)
+        if visibleFilter is None:
+            return jsonify({
+                "status": -2,
+                "message": "未限定范围"
+            })
+        query = query.filter(visibleFilter)
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
+        # 获取分页数据：传入cursor时按游标分页（空串为第一页），否则按页码分页
+        cursor = data.get("cursor")
+        nextCursor = None
+        if cursor is not None:
+            try:
+                clients, nextCursor = keysetPage(query, CLIENT_CURSOR_KEYS, cursor, int(page_size))
+            except ValueError as e:
                 return jsonify({
-                    "status": -2,
-                    "message": "未限定范围"
+                    "status": 400,
+                    "message": str(e)
                 })
-        # 获取分页数据
-        clients = query.offset(offset).limit(page_size).all()
-        clients = [Client.to_json(client) for client in clients]
+        else:
+            clients = query.offset(offset).limit(page_size).all()
+        clients = Client.bulk_to_json(clients, session)
 
         # 获取总数
-        total = query.count()
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
 
-        return jsonify({
+        res = {
             "status": 200,
             "message": "分页获取成功",
             "clients": clients,
             "total": total
+        }
+        if cursor is not None:
+            res["nextCursor"] = nextCursor
+        return jsonify(res)
+    except Exception as e:
+        session.rollback()
+        return jsonify({
+            "status": 500,
         })
+    finally:
+        session.close()
+
+
+# 按 getClients 的筛选条件和可见范围导出客户：服务端游标分批读取，每批用 bulk_to_json 批量查出关联名称后逐行写入文件
+def _clientExportRows(session, query):
+    # 分批读取时连接被游标占用，关联名称用另一个 session 查询
+    lookup = Session()
+    try:
+        result = session.execute(query.statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for clients in result.scalars().partitions():
+            countRows(len(clients))
+            for client in Client.bulk_to_json(clients, lookup):
+                yield [client.get(key) for _, key in CLIENT_EXPORT_COLUMNS]
+    finally:
+        lookup.close()
+
+
+@extraRouter.post("/exportClients")
+async def exportClients(request):
+    sessionid = request.headers.get("sessionid")
+    userId = checkSessionid(sessionid).get("userId")
+    if not userId:
+        return jsonify({
+            "status": -1,
+            "message": "用户未登录"
+        })
+
+    data = request.json()
+    fileFormat = data.get("format", "csv")
+    if fileFormat not in EXPORT_FORMATS:
+        return jsonify({
+            "status": 400,
+            "message": "导出格式错误"
+        })
+    session = Session()
+    try:
+        query = clientsQuery(session, data)
+        # 权限分割
+        visibleFilter = clientVisibleFilter(userId)
+        if visibleFilter is None:
+            return jsonify({
+                "status": -2,
+                "message": "未限定范围"
+            })
+        query = query.filter(visibleFilter)
+        path = writeExport(fileFormat, [title for title, _ in CLIENT_EXPORT_COLUMNS], _clientExportRows(session, query))
+        addLog(session, userId, "导出客户列表")
+        session.commit()
+        return exportResponse(path, "clients")
     except Exception as e:
         session.rollback()
         return jsonify({
             "status": 500,
+            "message": f"导出失败：{str(e)}"
         })
     finally:
         session.close()
@@ -369,43 +479,50 @@ async def getDealedClients(request):
     try:
         # 获取分页数据
         query = session.query(Client).filter(Client.processStatus == 2).order_by(Client.clientStatus,
-                                                                                 Client.createdTime.desc())
+                                                                                 Client.createdTime.desc(),
+                                                                                 Client.id.desc())
         if name:
             query = query.filter(Client.name.like(f"%{name}%"))
 
             # 权限分割
-        tag, schoolId, deptId = checkUserVisibleClient(userId)
-        match tag:
-            case 1:  # 本人相关
-                query = query.filter(
-                    or_(Client.affiliatedUserId == userId, Client.creatorId == userId, Client.appointerId == userId))
-            case 2:  # 本校区
-                teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.schoolId == schoolId)]
-                query = query.filter(
-                    or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                        Client.appointerId.in_(teacher_ids)))
-            case 3:  # 本部门
-                teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.departmentId == deptId)]
-                query = query.filter(
-                    or_(Client.affiliatedUserId.in_(teacher_ids), Client.creatorId.in_(teacher_ids),
-                        Client.appointerId.in_(teacher_ids)))
-            case 4:  # 全部
-                pass
-            case _:
+        visibleFilter = clientVisibleFilter(userId)
+        if visibleFilter is None:
+            return jsonify({
+                "status": -2,
+                "message": "未限定范围"
+            })
+        query = query.filter(visibleFilter)
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
+        # 传入cursor时按游标分页（空串为第一页），否则按页码分页
+        cursor = data.get("cursor")
+        nextCursor = None
+        if cursor is not None:
+            try:
+                clients, nextCursor = keysetPage(query, CLIENT_CURSOR_KEYS, cursor, int(page_size))
+            except ValueError as e:
                 return jsonify({
-                    "status": -2,
-                    "message": "未限定范围"
+                    "status": 400,
+                    "message": str(e)
                 })
-        clients = query.offset(offset).limit(page_size).all()
-        clients = [Client.to_json(client) for client in clients]
+        else:
+            clients = query.offset(offset).limit(page_size).all()
+        clients = Client.bulk_to_json(clients, session)
         # 获取总数
-        total = query.count()
-        return jsonify({
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
+        res = {
             "status": 200,
             "message": "分页获取成功",
             "clients": clients,
             "total": total
-        })
+        }
+        if cursor is not None:
+            res["nextCursor"] = nextCursor
+        return jsonify(res)
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -531,12 +648,11 @@ async def updateClient(request):
                             changes.append(f"{fieldsToSave[key]}: {old_value} -> {value}")
                 except Exception as e:
                     continue
+        client.syncContacts()
+        client.syncEnrollments()
         logContent = f"更新客户信息：" + "；".join(changes) if changes else "（无修改）"
-        log = Log(operatorId=userId,
-                  operation=logContent)
-        clientLog = ClientLog(clientId=client_id, operatorId=userId, operation=logContent)
-        session.add(log)
-        session.add(clientLog)
+        addLog(session, userId, logContent)
+        addClientLog(session, client_id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -587,11 +703,8 @@ async def addClientNote(request):
 
         # 记录操作日志
         logContent = f"添加备注：{note}"
-        log = Log(operatorId=userId, operation=logContent)
-        clientLog = ClientLog(clientId=client_id, operatorId=userId, operation=logContent)
-
-        session.add(log)
-        session.add(clientLog)
+        addLog(session, userId, logContent)
+        addClientLog(session, client_id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -659,10 +772,10 @@ async def addClient(request):
         data['info'] = [data.get("info")] if data.get('info') else []
         # 创建新客户
         new_client = Client(**data)
+        new_client.syncContacts()
+        new_client.syncEnrollments()
         session.add(new_client)
-        log = Log(operatorId=userId,
-                  operation=f"创建新客户：{data['name']}")
-        session.add(log)
+        addLog(session, userId, f"创建新客户：{data['name']}")
         session.commit()
 
         return jsonify({
@@ -715,9 +828,7 @@ async def deleteClient(request):
         # 删除客户
         session.delete(client)
         logContent = f"删除客户"
-        log = Log(operatorId=userId,
-                  operation=logContent)
-        session.add(log)
+        addLog(session, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -767,13 +878,8 @@ async def unassignClients(request):
             },
             synchronize_session=False
         )
-        log = Log(operatorId=userId,
-                  operation=f"取消分配客户：{[client.name for client in session.query(Client).filter(Client.id.in_(client_ids)).all()]}")
-        session.add(log)
-        for client_id in client_ids:
-            logContent = "取消分配"
-            clientLog = ClientLog(clientId=client_id, operatorId=userId, operation=logContent)
-            session.add(clientLog)
+        addLog(session, userId, f"取消分配客户：{[name for (name,) in session.query(Client.name).filter(Client.id.in_(client_ids))]}")
+        addClientLogs(session, client_ids, userId, "取消分配")
         session.commit()
 
         return jsonify({
@@ -830,13 +936,8 @@ async def assignClients(request):
             "clientStatus": 2,
             "affiliatedUserId": assigned_user_id
         }, synchronize_session=False)
-        log = Log(operatorId=userId,
-                  operation=f"分配客户：{[client.name for client in session.query(Client).filter(Client.id.in_(client_ids)).all()]}")
-        session.add(log)
-        for client_id in client_ids:
-            logContent = f"分配客服：{assigned_user.username}"
-            clientLog = ClientLog(clientId=client_id, operatorId=userId, operation=logContent)
-            session.add(clientLog)
+        addLog(session, userId, f"分配客户：{[name for (name,) in session.query(Client.name).filter(Client.id.in_(client_ids))]}")
+        addClientLogs(session, client_ids, userId, f"分配客服：{assigned_user.username}")
         session.commit()
         return jsonify({
             "status": 200,
@@ -878,11 +979,9 @@ async def convertToClients(request):
             client.clientStatus = 3  # 将状态改为正式客户
             client.toClientTime = datetime.now()
             # 记录操作日志
-            log = Log(operatorId=userId, operation=f"线索：{client.name}转为正式客户")
-            session.add(log)
+            addLog(session, userId, f"线索：{client.name}转为正式客户")
             logContent = "线索转为正式客户"
-            clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-            session.add(clientLog)
+            addClientLog(session, client.id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -947,14 +1046,13 @@ async def submitReserve(request):
         client.appointerId = appointerId
         client.appointDate = appointDate if appointDate else None
         client.courseIds = courseIds
+        client.syncEnrollments()
         client.nextTalkDate = nextTalkDate if nextTalkDate else None
         client.info.append(info)
         client.processStatus = 1
-        log = Log(operatorId=userId, operation=f"客户：{client.name}预约到店")
-        session.add(log)
+        addLog(session, userId, f"客户：{client.name}预约到店")
         logContent = "客户预约"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -1000,14 +1098,13 @@ async def cancelReserve(request):
         client.appointerId = None
         client.appointDate = None
         client.courseIds = None
+        client.syncEnrollments()
         client.nextTalkDate = None
         client.processStatus = None
         # 记录操作日志
-        log = Log(operatorId=userId, operation=f"客户：{client.name}取消预约")
-        session.add(log)
+        addLog(session, userId, f"客户：{client.name}取消预约")
         logContent = "取消预约"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
         return jsonify({
             "status": 200,
@@ -1060,11 +1157,9 @@ async def graduateClient(request):
         client.clientStatus = 5
 
         # 记录操作日志
-        log = Log(operatorId=userId, operation=f"学员：{client.name}已毕业")
-        session.add(log)
+        addLog(session, userId, f"学员：{client.name}已毕业")
         logContent = "学员毕业"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -1118,11 +1213,9 @@ async def cancelGraduate(request):
         client.clientStatus = 4
 
         # 记录操作日志
-        log = Log(operatorId=userId, operation=f"客户：{client.name}取消毕业")
-        session.add(log)
+        addLog(session, userId, f"客户：{client.name}取消毕业")
         logContent = "学员取消毕业"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -1166,80 +1259,20 @@ async def batchImportClues(request):
 
     session = Session()
     try:
-        success_count = 0
-        error_count = 0
-
-        # 定义唯一字段及其中文名称
-        uniqueFields = {
-            "phone": "电话",
-            "weixin": "微信",
-            "QQ": "QQ",
-            "douyin": "抖音",
-            "rednote": "小红书",
-            "shangwutong": "商务通"
-        }
-        error_msg = None
-        for clue in clues:
-            try:
-                # 数据转换
-                new_clue = {
-                    "name": clue.get("* 姓名", ""),
-                    "gender": 1 if clue.get("性别") == "男" else 2 if clue.get("性别") == "女" else None,
-                    "age": int(clue.get("年龄", 0)) if clue.get("年龄") else None,
-                    "IDNumber": clue.get("身份证", ""),
-                    "phone": clue.get("电话", ""),
-                    "weixin": clue.get("* 微信", ""),
-                    "QQ": clue.get("QQ", ""),
-                    "douyin": clue.get("抖音", ""),
-                    "rednote": clue.get("小红书", ""),
-                    "shangwutong": clue.get("商务通", ""),
-                    "address": clue.get("地区", ""),
-                    "info": [clue.get("备注", "")],
-                    "clientStatus": 1,  # 线索状态
-                    "creatorId": userId
-                }
-
-                # 验证必填字段
-                if not new_clue["name"] or not new_clue["weixin"]:
-                    error_msg = "未添线索姓名或微信"
-                    error_count += 1
-                    continue
-
-                # 检查唯一字段是否已被使用
-                field_exists = False
-                for field, field_name in uniqueFields.items():
-                    if new_clue[field]:  # 只检查非空字段
-                        # 查询是否已存在该字段值的客户
-                        existing_client = session.query(Client).filter(
-                            getattr(Client, field) == new_clue[field]).first()
-                        if existing_client:
-                            error_msg = f"存在{field_name}相同的客户等"
-                            field_exists = True
-                            break
-
-                if field_exists:
-                    error_count += 1
-                    continue
-
-                # 创建新线索
-                client = Client(**new_clue)
-                session.add(client)
-                success_count += 1
-
-            except Exception as e:
-                print(e)
-                error_count += 1
-                continue
-
+        # 整批查重后一次性插入
+        success_count, errors = importClues(session, clues, userId)
+        error_count = len(errors)
         session.commit()
 
         return jsonify({
             "status": 200,
             "message": f"导入完成：成功{success_count}条，失败{error_count}条" + (
-                f"。失败原因：{error_msg}" if error_msg else ""),
+                f"。失败原因：{errors[-1]['message']}等" if errors else ""),
             "data": {
                 "success": success_count,
-                "error": error_count
+                "error": error_count,
+                # 逐行失败原因：[{"row": 行号（从1开始）, "message": 原因}]
+                "errors": errors
             }
         })
 
@@ -1253,6 +1286,66 @@ async def batchImportClues(request):
         session.close()
 
 
+# 上传表格导入线索：文件在后台按批解析、查重、写入，立即返回任务id
+@extraRouter.post("/uploadClues")
+async def uploadClues(request):
+    sessionid = request.headers.get("sessionid")
+    userId = checkSessionid(sessionid).get("userId")
+    if not userId:
+        return jsonify({
+            "status": -1,
+            "message": "用户未登录"
+        })
+    if not checkUserAuthority(userId, 16):
+        return jsonify({
+            "status": -2,
+            "message": "无权限进行该操作"
+        })
+    # 字典{ 文件名: 文件 }
+    files: dict = request.files
+    if not files:
+        return jsonify({
+            "status": 400,
+            "message": "未上传文件"
+        })
+    fileName, fileData = next(iter(files.items()))
+    try:
+        jobId = submitImport(userId, fileName, fileData)
+    except ValueError as e:
+        return jsonify({
+            "status": 400,
+            "message": str(e)
+        })
+    return jsonify({
+        "status": 200,
+        "message": "导入任务已提交",
+        "jobId": jobId
+    })
+
+
+# 查询导入任务进度
+@extraRouter.post("/importStatus")
+async def importStatus(request):
+    sessionid = request.headers.get("sessionid")
+    userId = checkSessionid(sessionid).get("userId")
+    if not userId:
+        return jsonify({
+            "status": -1,
+            "message": "用户未登录"
+        })
+    data = request.json()
+    job = getImportJob(data.get("jobId"))
+    if not job or job.userId != userId:
+        return jsonify({
+            "status": 404,
+            "message": "导入任务不存在"
+        })
+    return jsonify({
+        "status": 200,
+        "job": job.to_json()
+    })
+
+
 # 客户付款
 @extraRouter.post("/submitPayment")
 async def submitPayment(request):
@@ -1283,22 +1376,18 @@ async def submitPayment(request):
             paymentDate=datetime.now().date()
         )
         session.add(payment)
+        applyPayment(session, payment)
 
         # 记录操作日志
         client = session.query(Client).get(data.get("clientId"))
         teacher = session.query(User).get(data.get("teacherId"))
         payType = "交定金" if data.get("category") == 1 else "交尾款" if data.get("category") == 2 else "付款"
-        log = Log(
-            operatorId=userId,
-            operation=f"客户：{client.name}{payType}{amount}元，负责老师：{teacher.username}"
-        )
-        session.add(log)
+        addLog(session, userId, f"客户：{client.name}{payType}{amount}元，负责老师：{teacher.username}")
         if amount > 0:
             logContent = f"{payType}{amount}元，负责老师：{teacher.username}"
         else:
             logContent = f"退款{-1 * amount}元，负责老师：{teacher.username}"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -1354,6 +1443,49 @@ async def getClientPayments(request):
         session.close()
 
 
+# 交易记录的筛选条件（不含可见范围），getPayments 与 exportPayments 共用
+def paymentsQuery(session, data):
+    paymentType = data.get("paymentType", "all")
+    query = session.query(Payment)
+
+    # 添加筛选条件
+    if data.get("schoolId"):
+        query = query.join(Payment.teacher).filter(
+            User.schoolId == data["schoolId"]
+        )
+    if paymentType == "income":
+        query = query.filter(Payment.amount > 0)
+    elif paymentType == "expense":
+        query = query.filter(Payment.amount <= 0)
+
+    if data.get("category"):
+        query = query.filter(Payment.category == data["category"])
+
+    if data.get("paymentMethod"):
+        query = query.filter(Payment.paymentMethod == data["paymentMethod"])
+
+    if data.get("clientName"):
+        # 必须用outerjoin，否则默认innerjoin，当没有Payment.client但存在Payment.receiver时无法找到
+        query = query.outerjoin(Payment.client).filter(
+            or_(
+                Client.name.contains(data["clientName"]),
+                Payment.receiver.contains(data["clientName"])
+            )
+        )
+
+    if data.get("clientPhone"):
+        query = query.join(Payment.client).filter(
+            Client.phone.contains(data["clientPhone"])
+        )
+
+    if data.get("startTime"):
+        query = query.filter(Payment.paymentDate >= data["startTime"])
+
+    if data.get("endTime"):
+        query = query.filter(Payment.paymentDate <= data["endTime"])
+    return query
+
+
 @extraRouter.post("/getPayments")
 async def getPayments(request):
     sessionid = request.headers.get("sessionid")
@@ -1367,70 +1499,27 @@ async def getPayments(request):
     data = request.json()
     page_index = data.get("pageIndex", 1)
     page_size = data.get("pageSize", 10)
-    paymentType = data.get("paymentType", "all")
 
     session = Session()
     try:
-        query = session.query(Payment)
-
-        # 添加筛选条件
-        if data.get("schoolId"):
-            query = query.join(Payment.teacher).filter(
-                User.schoolId == data["schoolId"]
-            )
-        if paymentType == "income":
-            query = query.filter(Payment.amount > 0)
-        elif paymentType == "expense":
-            query = query.filter(Payment.amount <= 0)
-
-        if data.get("category"):
-            query = query.filter(Payment.category == data["category"])
-
-        if data.get("paymentMethod"):
-            query = query.filter(Payment.paymentMethod == data["paymentMethod"])
-
-        if data.get("clientName"):
-            # 必须用outerjoin，否则默认innerjoin，当没有Payment.client但存在Payment.receiver时无法找到
-            query = query.outerjoin(Payment.client).filter(
-                or_(
-                    Client.name.contains(data["clientName"]),
-                    Payment.receiver.contains(data["clientName"])
-                )
-            )
-
-        if data.get("clientPhone"):
-            query = query.join(Payment.client).filter(
-                Client.phone.contains(data["clientPhone"])
-            )
-
-        if data.get("startTime"):
-            query = query.filter(Payment.paymentDate >= data["startTime"])
-
-        if data.get("endTime"):
-            query = query.filter(Payment.paymentDate <= data["endTime"])
+        query = paymentsQuery(session, data)
 
         # 权限分割
-        tag, schoolId, deptId = checkUserVisibleClient(userId)
-        match tag:
-            case 1:  # 本人相关
-                my_relevant_client_ids = [tid for (tid,) in session.query(Client.id).filter(
-                    or_(Client.creatorId == userId, Client.appointerId == userId, Client.affiliatedUserId == userId))]
-                query = query.filter(Payment.clientId.in_(my_relevant_client_ids))
-            case 2:  # 本校区
-                teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.schoolId == schoolId)]
-                query = query.filter(Payment.teacherId.in_(teacher_ids))
-            case 3:  # 本部门
-                teacher_ids = [tid for (tid,) in session.query(User.id).filter(User.departmentId == deptId)]
-                query = query.filter(Payment.teacherId.in_(teacher_ids))
-            case 4:  # 全部
-                pass
-            case _:
-                return jsonify({
-                    "status": -2,
-                    "message": "未限定范围"
-                })
+        visibleFilter = paymentVisibleFilter(userId)
+        if visibleFilter is None:
+            return jsonify({
+                "status": -2,
+                "message": "未限定范围"
+            })
+        query = query.filter(visibleFilter)
 
-        total = query.count()
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
         payments = query.order_by(Payment.paymentDate.desc(), Payment.id.desc()).offset(
             (int(page_index) - 1) * int(page_size)).limit(int(page_size)).all()
 
@@ -1449,6 +1538,173 @@ async def getPayments(request):
         session.close()
 
 
+# 导出的行直接从服务端游标逐批读出，不构造 ORM 对象
+def _streamRows(session, statement):
+    result = session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        countRows(len(rows))
+        yield from rows
+
+
+# 按 getPayments 的筛选条件和可见范围导出交易记录：客户、老师、校区名称在同一条查询中关联取出
+@extraRouter.post("/exportPayments")
+async def exportPayments(request):
+    sessionid = request.headers.get("sessionid")
+    userId = checkSessionid(sessionid).get("userId")
+    if not userId:
+        return jsonify({
+            "status": -1,
+            "message": "用户未登录"
+        })
+
+    data = request.json()
+    fileFormat = data.get("format", "csv")
+    if fileFormat not in EXPORT_FORMATS:
+        return jsonify({
+            "status": 400,
+            "message": "导出格式错误"
+        })
+    session = Session()
+    try:
+        query = paymentsQuery(session, data)
+        # 权限分割
+        visibleFilter = paymentVisibleFilter(userId)
+        if visibleFilter is None:
+            return jsonify({
+                "status": -2,
+                "message": "未限定范围"
+            })
+        query = query.filter(visibleFilter)
+        # 筛选条件中可能已关联客户、老师，导出用的关联使用别名以免冲突
+        client, teacher, school = aliased(Client), aliased(User), aliased(School)
+        statement = query.with_entities(
+            Payment.id, Payment.paymentDate, Payment.amount, Payment.category, Payment.paymentMethod,
+            client.name, client.phone, Payment.receiver, teacher.username, school.name, Payment.info
+        ).outerjoin(client, Payment.clientId == client.id).outerjoin(teacher, Payment.teacherId == teacher.id) \
+            .outerjoin(school, teacher.schoolId == school.id) \
+            .order_by(Payment.paymentDate.desc(), Payment.id.desc()).statement
+        path = writeExport(fileFormat, PAYMENT_EXPORT_HEADER, _streamRows(session, statement))
+        addLog(session, userId, "导出交易记录")
+        session.commit()
+        return exportResponse(path, "payments")
+    except Exception as e:
+        session.rollback()
+        return jsonify({
+            "status": 500,
+            "message": f"导出失败：{str(e)}"
+        })
+    finally:
+        session.close()
+
+
+# 导出校区收支日台账，权限与交易汇总一致
+@extraRouter.post("/exportSchoolLedger")
+async def exportSchoolLedger(request):
+    sessionid = request.headers.get("sessionid")
+    userId = checkSessionid(sessionid).get("userId")
+    if not userId:
+        return jsonify({
+            "status": -1,
+            "message": "用户未登录"
+        })
+
+    data = request.json()
+    fileFormat = data.get("format", "csv")
+    if fileFormat not in EXPORT_FORMATS:
+        return jsonify({
+            "status": 400,
+            "message": "导出格式错误"
+        })
+    # 权限分割：可查看全部的用户可导出任一或全部校区，可查看本校区的用户只能导出本校区
+    tag, userSchoolId, _ = checkUserVisibleClient(userId)
+    schoolId = data.get("schoolId") if data.get("schoolId") != "null" else None
+    if tag == 2:
+        schoolId = userSchoolId
+    elif tag != 4:
+        return jsonify({
+            "status": -2,
+            "message": "无权查看校区汇总"
+        })
+
+    session = Session()
+    try:
+        statement = select(School.name, SchoolLedger.date, SchoolLedger.income, SchoolLedger.expense,
+                           SchoolLedger.income + SchoolLedger.expense, SchoolLedger.closingBalance) \
+            .join(School, SchoolLedger.schoolId == School.id).order_by(SchoolLedger.schoolId, SchoolLedger.date)
+        if schoolId:
+            statement = statement.where(SchoolLedger.schoolId == schoolId)
+        if data.get("startDate"):
+            statement = statement.where(SchoolLedger.date >= data["startDate"])
+        if data.get("endDate"):
+            statement = statement.where(SchoolLedger.date <= data["endDate"])
+        path = writeExport(fileFormat, LEDGER_EXPORT_HEADER, _streamRows(session, statement))
+        addLog(session, userId, "导出校区台账")
+        session.commit()
+        return exportResponse(path, "ledger")
+    except Exception as e:
+        session.rollback()
+        return jsonify({
+            "status": 500,
+            "message": f"导出失败：{str(e)}"
+        })
+    finally:
+        session.close()
+
+
+# 按日/周/月统计收支（读预聚合的交易汇总表），可按校区、类别、支付方式分组
+@extraRouter.post("/getPaymentSummary")
+async def getPaymentSummary(request):
+    sessionid = request.headers.get("sessionid")
+    userId = checkSessionid(sessionid).get("userId")
+    if not userId:
+        return jsonify({
+            "status": -1,
+            "message": "用户未登录"
+        })
+
+    data = request.json()
+    granularity = data.get("granularity") or "month"
+    groupBy = data.get("groupBy") or []
+    if granularity not in SUMMARY_PERIODS or not isinstance(groupBy, list) \
+            or any(name not in SUMMARY_DIMENSIONS for name in groupBy):
+        return jsonify({
+            "status": 400,
+            "message": "统计参数错误"
+        })
+
+    # 权限分割：汇总按校区统计，只对可查看全部或本校区的用户开放
+    tag, userSchoolId, _ = checkUserVisibleClient(userId)
+    schoolId = data.get("schoolId") if data.get("schoolId") != "null" else None
+    if tag == 2:
+        schoolId = userSchoolId
+    elif tag != 4:
+        return jsonify({
+            "status": -2,
+            "message": "无权查看校区汇总"
+        })
+
+    session = Session()
+    try:
+        summary = paymentSummary(session, schoolId, data.get("startDate"), data.get("endDate"),
+                                 granularity, groupBy)
+        return jsonify({
+            "status": 200,
+            "summary": summary,
+            "total": {
+                "income": sum(item["income"] for item in summary),
+                "expense": sum(item["expense"] for item in summary),
+                "count": sum(item["count"] for item in summary),
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            "status": 500,
+            "message": f"获取交易汇总失败：{str(e)}"
+        })
+    finally:
+        session.close()
+
+
 @extraRouter.post("/addPayment")
 async def addPayment(request):
     sessionid = request.headers.get("sessionid")
@@ -1484,6 +1740,7 @@ async def addPayment(request):
         payment.creatorId = userId
 
         session.add(payment)
+        applyPayment(session, payment)
         session.commit()
         return jsonify({
             "status": 200,
@@ -1535,6 +1792,8 @@ async def updatePayment(request):
                 "message": "记录不存在"
             })
 
+        # 台账、交易汇总：先撤销原记录，再计入新记录
+        applyPayment(session, payment, -1)
         payment.clientId = data.get("clientId") if data.get("clientId") != "null" else None
         payment.receiver = data.get("receiver")
         payment.teacherId = data.get("teacherId")
@@ -1542,6 +1801,7 @@ async def updatePayment(request):
         payment.category = data.get("category")
         payment.paymentMethod = data.get("paymentMethod")
         payment.info = data.get("info")
+        applyPayment(session, payment)
 
         session.commit()
         return jsonify({
@@ -1589,6 +1849,7 @@ async def deletePayment(request):
                 "message": "记录不存在"
             })
 
+        applyPayment(session, payment, -1)
         session.delete(payment)
         session.commit()
         return jsonify({
@@ -1635,12 +1896,18 @@ async def getLogs(request):
         if data.get("endTime"):
             query = query.filter(Log.time <= data["endTime"])
 
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
         # 获取分页数据
         logs = query.offset(offset).limit(page_size).all()
         logs = [log.to_json() for log in logs]
 
         # 获取总数
-        total = query.count()
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
 
         return jsonify({
             "status": 200,
@@ -1676,12 +1943,18 @@ async def getClientLogs(request):
     try:
         # 构建查询
         query = session.query(ClientLog).filter(ClientLog.clientId == clientId).order_by(ClientLog.time.desc())
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
         # 获取分页数据
         clientLogs = query.offset(offset).limit(page_size).all()
         logs = [log.to_json() for log in clientLogs]
 
         # 获取总数
-        total = query.count()
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
         return jsonify({
             "status": 200,
             "message": "获取日志成功",
@@ -1736,11 +2009,9 @@ async def confirmCooperation(request):
         client.cooperateTime = datetime.now()
 
         # 记录操作日志
-        log = Log(operatorId=userId, operation=f"客户：{client.name}确认成单")
-        session.add(log)
+        addLog(session, userId, f"客户：{client.name}确认成单")
         logContent = f"确认成单"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -1795,11 +2066,9 @@ async def cancelCooperation(request):
         client.cooperateTime = None
 
         # 记录操作日志
-        log = Log(operatorId=userId, operation=f"客户：{client.name}取消成单")
-        session.add(log)
+        addLog(session, userId, f"客户：{client.name}取消成单")
         logContent = "取消成单"
-        clientLog = ClientLog(clientId=client.id, operatorId=userId, operation=logContent)
-        session.add(clientLog)
+        addClientLog(session, client.id, userId, logContent)
         session.commit()
 
         return jsonify({
@@ -1,9 +1,16 @@
 import json
 import time
-from robyn import SubRouter, jsonify
 
 from models import *
-from utils.hooks import calcSignature, encode, checkSessionid, checkAdminOnly, checkUserAuthority, clearLogs
+from utils.audit import addLog
+from utils.encoder import jsonify
+from utils.etag import referenceResponse
+from utils.hooks import calcSignature, encode, checkSessionid, checkAdminOnly, checkUserAuthority, invalidateUserAuth
+from utils.cache import cachedCount
+from utils.ledger import rebuildSchoolLedger, rebuildPaymentRollup
+from utils.pagination import flagOf
+from utils.passwords import PasswordBusy, hashPassword, checkPassword
+from utils.router import SubRouter
 
 userRouter = SubRouter(__file__, prefix="/user")
 
@@ -59,7 +66,9 @@ async def login(request):
                 "message": "用户不存在",
             })
         password = data["password"]
-        if not user.checkPassword(password):
+        # 密码校验耗时较长，先关闭会话归还数据库连接（已加载的属性仍可读取），校验通过后另开会话写日志
+        session.close()
+        if not await checkPassword(password, user.hashedPassword):
             return jsonify({
                 "status": -2,
                 "message": "密码错误"
@@ -72,15 +81,20 @@ async def login(request):
         signature = calcSignature(user.id)
         rawSessionid = f"userId={user.id}&timestamp={int(time.time())}&signature={signature}&algorithm=sha256"
         sessionid = encode(rawSessionid)
-        log = Log(operatorId=user.id, operation="用户登录")
-        session.add(log)
-        clearLogs()
+        session = Session()
+        addLog(session, user.id, "用户登录")
         session.commit()
         return jsonify({
             "status": 200,
             "message": "登录成功",
             "sessionid": sessionid,
         })
+    except PasswordBusy:
+        session.rollback()
+        return jsonify({
+            "status": 503,
+            "message": "系统繁忙，请稍后再试"
+        })
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -131,6 +145,8 @@ async def register(request):
     try:
         form = request.json()["form"]
         form = json.loads(form)
+        # 先计算密码哈希再查询数据库，等待期间不占用数据库连接
+        hashedPassword = await hashPassword(form["password"])
         username = form["username"]
         gender = form["gender"]
         phone = form["phone"]
@@ -142,20 +158,24 @@ async def register(request):
             schoolId = department.schoolId
         vocationId = form["vocationId"]
         status = form["status"]
-        password = form["password"]
         user = User(username=username, gender=gender, phone=phone, address=address, departmentId=departmentId,
                     schoolId=schoolId,
                     vocationId=vocationId, status=status, usertype=1, clientVisible=1,
-                    hashedPassword=User.hashPassword(password))
-        log = Log(operatorId=userId, operation=f"添加用户：{username}")
+                    hashedPassword=hashedPassword)
+        addLog(session, userId, f"添加用户：{username}")
 
         session.add(user)
-        session.add(log)
         session.commit()
         return jsonify({
             "status": 200,
             "message": "用户添加成功"
         })
+    except PasswordBusy:
+        session.rollback()
+        return jsonify({
+            "status": 503,
+            "message": "系统繁忙，请稍后再试"
+        })
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -181,20 +201,31 @@ async def modifyPwd(request):
         form = request.json()["form"]
         form = json.loads(form)
         oldPwd = form["oldPwd"]
-        if not user.checkPassword(oldPwd):
+        # 密码计算耗时较长，先关闭会话归还数据库连接，计算完成后另开会话重新查询用户并修改
+        hashedPassword = user.hashedPassword
+        session.close()
+        if not await checkPassword(oldPwd, hashedPassword):
             return jsonify({
                 "status": -2,
                 "message": "旧密码输入错误"
             })
         newPwd = form["newPwd"]
-        user.hashedPassword = User.hashPassword(newPwd)
-        log = Log(operatorId=user.id, operation="修改密码")
-        session.add(log)
+        newHashedPassword = await hashPassword(newPwd)
+        session = Session()
+        user = session.query(User).get(userId)
+        user.hashedPassword = newHashedPassword
+        addLog(session, user.id, "修改密码")
         session.commit()
         return jsonify({
             "status": 200,
             "message": "密码修改成功"
         })
+    except PasswordBusy:
+        session.rollback()
+        return jsonify({
+            "status": 503,
+            "message": "系统繁忙，请稍后再试"
+        })
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -231,10 +262,16 @@ async def getAllUsers(request):
             query = query.filter(User.schoolId == schoolId).order_by(User.schoolId)
         if deptId:
             query = query.filter(User.departmentId == deptId).order_by(User.schoolId)
+        # 只返回总数：前端可先带 skipTotal 取分页数据，再单独取总数
+        if flagOf(data, "countOnly"):
+            return jsonify({
+                "status": 200,
+                "total": cachedCount(query)
+            })
         users = query.offset(offset).limit(page_size).all()
         users = [User.to_json(user) for user in users]
         # 获取总数
-        total = query.count()
+        total = None if flagOf(data, "skipTotal") else cachedCount(query)
         return jsonify({
             "status": 200,
             "message": "分页获取成功",
@@ -277,6 +314,7 @@ async def updateUser(request):
                 "status": -3,
                 "message": "用户不存在"
             })
+        oldSchoolId = user.schoolId
 
         # 更新用户信息
         for key, value in data.items():
@@ -288,13 +326,17 @@ async def updateUser(request):
                 except Exception as e:
                     continue
 
+        # 调校区后交易记录的归属校区随之变化，重建两个校区的台账和交易汇总
+        if str(user.schoolId) != str(oldSchoolId):
+            session.flush()
+            for schoolId in {oldSchoolId, user.schoolId} - {None}:
+                rebuildSchoolLedger(session, schoolId)
+                rebuildPaymentRollup(session, schoolId)
+
         # 记录操作日志
-        log = Log(
-            operatorId=operatorId,
-            operation=f"更新用户信息：{user.username}"
-        )
-        session.add(log)
+        addLog(session, operatorId, f"更新用户信息：{user.username}")
         session.commit()
+        invalidateUserAuth(user_id)
 
         return jsonify({
             "status": 200,
@@ -351,15 +393,12 @@ async def deleteUser(request):
             })
 
         # 记录操作日志
-        log = Log(
-            operatorId=operatorId,
-            operation=f"删除用户：{user.username}"
-        )
-        session.add(log)
+        addLog(session, operatorId, f"删除用户：{user.username}")
 
         # 删除用户
         session.delete(user)
         session.commit()
+        invalidateUserAuth(user_id)
 
         return jsonify({
             "status": 200,
@@ -401,6 +440,8 @@ async def initUserPwd(request):
 
     session = Session()
     try:
+        # 先计算密码哈希再查询数据库，等待期间不占用数据库连接
+        hashedPassword = await hashPassword("12345")
         # 获取用户信息
         user = session.query(User).filter(User.id == user_id).first()
         if not user:
@@ -409,13 +450,19 @@ async def initUserPwd(request):
                 "message": "用户不存在"
             })
 
-        user.hashedPassword = User.hashPassword("12345")
+        user.hashedPassword = hashedPassword
         session.commit()
 
         return jsonify({
             "status": 200,
             "message": "密码初始化成功"
         })
+    except PasswordBusy:
+        session.rollback()
+        return jsonify({
+            "status": 503,
+            "message": "系统繁忙，请稍后再试"
+        })
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -437,13 +484,11 @@ async def getAllVocations(request):
         })
     session = Session()
     try:
-        vocations = session.query(Role).all()
-        vocations = [vocation.to_json() for vocation in vocations]
-        return jsonify({
+        return referenceResponse(request, ("getAllVocations",), ["role"], lambda: jsonify({
             "status": 200,
             "message": "全部职位获取成功",
-            "vocations": vocations,
-        })
+            "vocations": [vocation.to_json() for vocation in session.query(Role).all()],
+        }))
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -465,13 +510,12 @@ async def getAllAuthorities(request):
         })
     session = Session()
     try:
-        authorities = session.query(Authority).order_by(Authority.module).all()
-        authorities = [authority.to_json() for authority in authorities]
-        return jsonify({
+        return referenceResponse(request, ("getAllAuthorities",), ["authority"], lambda: jsonify({
             "status": 200,
             "message": "全部权限获取成功",
-            "authorities": authorities,
-        })
+            "authorities": [authority.to_json()
+                            for authority in session.query(Authority).order_by(Authority.module).all()],
+        }))
     except Exception as e:
         session.rollback()
         return jsonify({
@@ -506,6 +550,8 @@ async def updateVocationAuthority(request):
         vocation = session.query(Role).get(vocationId)
         vocation.authority = authorities
         session.commit()
+        # 职位下所有用户的权限都受影响
+        invalidateUserAuth()
         return jsonify({
             "status": 200,
             "message": "职位权限修改成功",
@@ -541,6 +587,7 @@ async def addVocation(request):
         vocation = Role(name=name)
         session.add(vocation)
         session.commit()
+        invalidateUserAuth()
 
         return jsonify({
             "status": 200,
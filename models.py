@@ -1,15 +1,17 @@
 from datetime import datetime
-from sqlalchemy import create_engine, ForeignKey, Boolean, Column, Integer, Text, DateTime, Date, Float, JSON
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import create_engine, ForeignKey, Boolean, Column, Integer, Text, String, DateTime, Date, Float, JSON, \
+    Index, UniqueConstraint, select, union, func, distinct
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship, backref, joinedload, Bundle
 from sqlalchemy.ext.mutable import MutableList
-from bcrypt import hashpw, gensalt, checkpw
 
+import config
 from config import DATABASE_URI
+from utils.passwords import hashPasswordSync, checkPasswordSync
 
 # 配置连接池参数，增加连接池大小和最大溢出数
 engine = create_engine(
     DATABASE_URI, 
-    echo=True,
+    echo=getattr(config, "SQL_ECHO", False),  # 逐条打印 SQL，仅调试时开启；慢查询见 utils/slowlog.py
     pool_size=20,  # 默认连接池大小
     max_overflow=30,  # 最大溢出连接数
     pool_timeout=60,  # 连接超时时间
@@ -74,11 +76,10 @@ class User(Base):
 
     @staticmethod  # 静态方法归属于类的命名空间，同时能够在不依赖类的实例的情况下调用
     def hashPassword(password):
-        hashedPwd = hashpw(password.encode("utf-8"), gensalt())
-        return hashedPwd.decode("utf-8")
+        return hashPasswordSync(password)
 
     def checkPassword(self, password):
-        return checkpw(password.encode("utf-8"), self.hashedPassword.encode("utf-8"))
+        return checkPasswordSync(password, self.hashedPassword)
 
     def to_json(self):
         data = {
@@ -161,6 +162,8 @@ class Department(Base):
 
 class Client(Base):
     __tablename__ = "client"
+    # 列表按 (clientStatus, createdTime) 排序并游标分页
+    __table_args__ = (Index("ix_client_clientStatus_createdTime", "clientStatus", "createdTime"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(Text, nullable=True)
     #  * 渠道来源：
@@ -201,7 +204,7 @@ class Client(Base):
         session.close()
         return creator.username
 
-    createdTime = Column(DateTime, nullable=True, default=datetime.now)
+    createdTime = Column(DateTime, nullable=True, default=datetime.now, index=True)
     # 客户备注
     info = Column(MutableList.as_mutable(JSON()), nullable=True, default=[])
 
@@ -294,9 +297,75 @@ class Client(Base):
     # 入住时间
     bedCheckInDate = Column(Date, nullable=True)
     # 离住时间
-    bedCheckOutDate = Column(Date, nullable=True)
+    bedCheckOutDate = Column(Date, nullable=True, index=True)
 
     def to_json(self):
+        combo = None
+        if self.comboId:
+            session = Session()
+            combo = session.query(CourseCombo).get(self.comboId)
+            session.close()
+        affiliatedUserName = self.affiliatedUser.username if self.affiliatedUserId else None
+        return self._build_json(self.creatorName, self.appointerName, self.schoolId, self.schoolName,
+                                self.courseNames, affiliatedUserName, combo)
+
+    # 批量序列化：用固定几次 IN 查询预加载关联的用户、校区、课程、套餐，输出与逐条 to_json 完全一致
+    @staticmethod
+    def bulk_to_json(clients, session):
+        userIds = {userId for client in clients
+                   for userId in (client.creatorId, client.appointerId, client.affiliatedUserId) if userId}
+        users = {user.id: user for user in session.query(User).filter(User.id.in_(userIds))} if userIds else {}
+        schoolIds = {user.schoolId for user in users.values() if user.schoolId}
+        schools = {school.id: school for school in
+                   session.query(School).filter(School.id.in_(schoolIds))} if schoolIds else {}
+        courseIds = {courseId for client in clients for courseId in (client.courseIds or [])}
+        courses = {course.id: course for course in
+                   session.query(Course).filter(Course.id.in_(courseIds))} if courseIds else {}
+        comboIds = {client.comboId for client in clients if client.comboId}
+        combos = {combo.id: combo for combo in
+                  session.query(CourseCombo).filter(CourseCombo.id.in_(comboIds))} if comboIds else {}
+
+        def schoolNameOf(user):
+            school = schools.get(user.schoolId)
+            return school.name if school else ""
+
+        result = []
+        for client in clients:
+            creator = users.get(client.creatorId)
+            appointer = users.get(client.appointerId)
+            affiliatedUser = users.get(client.affiliatedUserId)
+            # 校区优先级与 Client.schoolId / Client.schoolName 属性保持一致
+            if affiliatedUser:
+                schoolId = affiliatedUser.schoolId
+            elif appointer and appointer.schoolId:
+                schoolId = appointer.schoolId
+            elif creator and creator.schoolId:
+                schoolId = creator.schoolId
+            else:
+                schoolId = None
+            if appointer and appointer.schoolId:
+                schoolName = schoolNameOf(appointer)
+            elif affiliatedUser:
+                schoolName = schoolNameOf(affiliatedUser)
+            elif creator and creator.schoolId:
+                schoolName = schoolNameOf(creator)
+            else:
+                schoolName = ""
+            courseNames = ""
+            if client.courseIds:
+                courseNames = "，".join(courses[courseId].name for courseId in client.courseIds if courseId in courses)
+            result.append(client._build_json(
+                creator.username if creator else "",
+                appointer.username if appointer else "",
+                schoolId,
+                schoolName,
+                courseNames,
+                affiliatedUser.username if affiliatedUser else None,
+                combos.get(client.comboId),
+            ))
+        return result
+
+    def _build_json(self, creatorName, appointerName, schoolId, schoolName, courseNames, affiliatedUserName, combo):
         data = {
             "id": self.id,
             "name": self.name,
@@ -314,15 +383,15 @@ class Client(Base):
             "clientStatus": self.clientStatus,
             "affiliatedUserId": self.affiliatedUserId,
             "creatorId": self.creatorId,
-            "creatorName": self.creatorName,
+            "creatorName": creatorName,
             "createdTime": self.createdTime,
             "toClientTime": self.toClientTime,
             "appointerId": self.appointerId,
-            "appointerName": self.appointerName,
-            "schoolId": self.schoolId,
-            "schoolName": self.schoolName,
+            "appointerName": appointerName,
+            "schoolId": schoolId,
+            "schoolName": schoolName,
             "courseIds": self.courseIds,
-            "courseNames": self.courseNames,
+            "courseNames": courseNames,
             "comboId": self.comboId,
             "lessonIds": self.lessonIds,
             "graduatedLessonIds": self.graduatedLessonIds,
@@ -339,19 +408,118 @@ class Client(Base):
         if self.info:
             data["info"] = [info for info in self.info if info != ""]
         if self.affiliatedUserId:
-            data["affiliatedUserName"] = self.affiliatedUser.username
-        if self.comboId:
-            session = Session()
-            combo = session.query(CourseCombo).get(self.comboId)
-            if combo:
-                data["comboName"] = combo.showName
-                data["comboPrice"] = combo.price
-            session.close()
+            data["affiliatedUserName"] = affiliatedUserName
+        if combo:
+            data["comboName"] = combo.showName
+            data["comboPrice"] = combo.price
         # 数据过大了
         # if self.bedId:
         #     data["bed"] = self.bed.to_json()
         return data
 
+    # 同步联系方式索引表：新增、修改客户联系方式后调用
+    def syncContacts(self):
+        wanted = {(kind, str(getattr(self, kind))[:ClientContact.VALUE_LENGTH])
+                  for kind in ClientContact.KINDS if getattr(self, kind)}
+        for contact in list(self.contacts):
+            if (contact.kind, contact.value) in wanted:
+                wanted.discard((contact.kind, contact.value))
+            else:
+                self.contacts.remove(contact)
+        for kind, value in sorted(wanted):
+            self.contacts.append(ClientContact(kind=kind, value=value))
+
+    @staticmethod
+    def _idSet(ids):
+        if not isinstance(ids, list):
+            return set()
+        return {int(i) for i in ids if isinstance(i, int) or (isinstance(i, str) and i.isdigit())}
+
+    # 同步报名关联表：修改 courseIds / lessonIds / graduatedLessonIds 后调用（与 JSON 字段双写）
+    def syncEnrollments(self):
+        courseIds = Client._idSet(self.courseIds)
+        for link in list(self.courseLinks):
+            if link.courseId in courseIds:
+                courseIds.discard(link.courseId)
+            else:
+                self.courseLinks.remove(link)
+        for courseId in sorted(courseIds):
+            self.courseLinks.append(ClientCourse(courseId=courseId))
+
+        lessonIds = Client._idSet(self.lessonIds)
+        graduatedIds = Client._idSet(self.graduatedLessonIds)
+        wanted = {lessonId: (lessonId in lessonIds, lessonId in graduatedIds) for lessonId in lessonIds | graduatedIds}
+        for link in list(self.lessonLinks):
+            if link.lessonId in wanted:
+                link.enrolled, link.graduated = wanted.pop(link.lessonId)
+            else:
+                self.lessonLinks.remove(link)
+        for lessonId, (enrolled, graduated) in sorted(wanted.items()):
+            self.lessonLinks.append(ClientLesson(lessonId=lessonId, enrolled=enrolled, graduated=graduated))
+
+
+# 客户联系方式索引表：把客户的各个联系方式拆成行，查找时可以走索引而不是全表 LIKE
+class ClientContact(Base):
+    __tablename__ = "client_contact"
+    # 参与搜索的联系方式字段
+    KINDS = ("weixin", "phone", "QQ", "douyin", "shangwutong")
+    VALUE_LENGTH = 191
+    # MySQL ngram 分词长度（ngram_token_size，默认2），短于它的关键词无法走全文索引
+    NGRAM_TOKEN_SIZE = 2
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    clientId = Column(Integer, ForeignKey("client.id", ondelete="CASCADE"), nullable=False, index=True)
+    client = relationship("Client", backref=backref("contacts", cascade="all, delete-orphan"))
+    kind = Column(String(16), nullable=False)
+    value = Column(String(VALUE_LENGTH), nullable=False)
+    __table_args__ = (
+        # 精确、前缀查找走 B-tree
+        Index("ix_client_contact_value", "value"),
+        # 子串查找走 ngram 全文索引（仅 MySQL）
+        Index("ix_client_contact_value_ngram", "value", mysql_prefix="FULLTEXT", mysql_with_parser="ngram"),
+    )
+
+    # 按联系方式子串查找客户id的子查询：前缀匹配走 B-tree；
+    # 子串匹配在 MySQL 上先用全文索引圈定候选行，再用 LIKE 精确过滤，其他数据库直接 LIKE
+    @staticmethod
+    def matchClientIds(contact, dialectName):
+        contains = ClientContact.value.contains(contact, autoescape=True)
+        if dialectName != "mysql" or len(contact) < ClientContact.NGRAM_TOKEN_SIZE:
+            return select(ClientContact.clientId).where(contains)
+        prefix = select(ClientContact.clientId).where(ClientContact.value.startswith(contact, autoescape=True))
+        phrase = '"' + contact.replace('"', " ") + '"'
+        substring = select(ClientContact.clientId).where(ClientContact.value.match(phrase), contains)
+        return union(prefix, substring)
+
+
+# 学员-课程关联表（对应 Client.courseIds），按课程查学员时走索引
+# courseId 不建外键：JSON 字段中可能残留已删除课程的id，保持与原数据一致
+class ClientCourse(Base):
+    __tablename__ = "client_course"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    clientId = Column(Integer, ForeignKey("client.id", ondelete="CASCADE"), nullable=False)
+    client = relationship("Client", backref=backref("courseLinks", cascade="all, delete-orphan"))
+    courseId = Column(Integer, nullable=False, index=True)
+    __table_args__ = (UniqueConstraint("clientId", "courseId"),)
+
+
+# 学员-班级关联表（对应 Client.lessonIds / graduatedLessonIds）
+class ClientLesson(Base):
+    __tablename__ = "client_lesson"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    clientId = Column(Integer, ForeignKey("client.id", ondelete="CASCADE"), nullable=False)
+    client = relationship("Client", backref=backref("lessonLinks", cascade="all, delete-orphan"))
+    lessonId = Column(Integer, nullable=False)
+    # 是否在班（lessonIds 中）
+    enrolled = Column(Boolean, nullable=False, default=True)
+    # 是否已毕业（graduatedLessonIds 中）
+    graduated = Column(Boolean, nullable=False, default=False)
+    __table_args__ = (
+        UniqueConstraint("clientId", "lessonId"),
+        Index("ix_client_lesson_lessonId_enrolled", "lessonId", "enrolled"),
+        Index("ix_client_lesson_lessonId_graduated", "lessonId", "graduated"),
+    )
+
 
 class School(Base):
     __tablename__ = "school"
@@ -577,7 +745,7 @@ class Payment(Base):
     paymentMethod = Column(Integer, nullable=True)
     # 备注
     info = Column(Text, nullable=True)
-    paymentDate = Column(Date, nullable=True)
+    paymentDate = Column(Date, nullable=True, index=True)
 
     def to_json(self):
         data = {
@@ -600,6 +768,36 @@ class Payment(Base):
         return data
 
 
+# 校区收支日台账：每个校区每天一行，closingBalance 为截至当天（含）的累计余额
+# 校区取负责老师当前所属校区；由交易记录的增删改同步维护（utils/ledger.py）
+class SchoolLedger(Base):
+    __tablename__ = "school_ledger"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    schoolId = Column(Integer, ForeignKey("school.id", ondelete="CASCADE"), nullable=False)
+    date = Column(Date, nullable=False)
+    # 当天收入、支出（支出为负数）
+    income = Column(Integer, nullable=False, default=0)
+    expense = Column(Integer, nullable=False, default=0)
+    closingBalance = Column(Integer, nullable=False, default=0)
+    __table_args__ = (UniqueConstraint("schoolId", "date"),)
+
+
+# 交易汇总：按校区、日期、类别、支付方式预聚合，供财务报表按日/周/月统计
+# 未填写的类别、支付方式记为0；由交易记录的增删改同步维护（utils/ledger.py）
+class PaymentRollup(Base):
+    __tablename__ = "payment_rollup"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    schoolId = Column(Integer, ForeignKey("school.id", ondelete="CASCADE"), nullable=False)
+    date = Column(Date, nullable=False)
+    category = Column(Integer, nullable=False, default=0)
+    paymentMethod = Column(Integer, nullable=False, default=0)
+    income = Column(Integer, nullable=False, default=0)
+    expense = Column(Integer, nullable=False, default=0)
+    # 交易笔数
+    count = Column(Integer, nullable=False, default=0)
+    __table_args__ = (UniqueConstraint("schoolId", "date", "category", "paymentMethod"),)
+
+
 class Dormitory(Base):
     __tablename__ = "dormitory"
     id = Column(Integer, primary_key=True)
@@ -610,6 +808,19 @@ class Dormitory(Base):
     schoolId = Column(Integer, ForeignKey("school.id"), nullable=True)
     school = relationship("School", backref="dormitories")
 
+    # 批量统计房间数、床位数、已住床位数：{dormitoryId: (roomCount, totalBeds, occupiedBeds)}
+    @staticmethod
+    def occupancyOf(session, dormitoryIds):
+        if not dormitoryIds:
+            return {}
+        rows = session.query(
+            Room.dormitoryId, func.count(distinct(Room.id)), func.count(distinct(Bed.id)),
+            func.count(distinct(Client.bedId))
+        ).outerjoin(Bed, Bed.roomId == Room.id).outerjoin(Client, Client.bedId == Bed.id).filter(
+            Room.dormitoryId.in_(dormitoryIds)
+        ).group_by(Room.dormitoryId).all()
+        return {dormitoryId: tuple(counts) for dormitoryId, *counts in rows}
+
     @property
     def roomCount(self):
         session = Session()
@@ -617,13 +828,17 @@ class Dormitory(Base):
         session.close()
         return roomCount
 
-    def to_json(self):
+    # occupancy 为 occupancyOf 的统计结果，由调用方批量查询后传入
+    def to_json(self, occupancy):
+        roomCount, totalBeds, occupiedBeds = occupancy
         data = {
             "id": self.id,
             "name": self.name,
             "category": self.category,
             "schoolId": self.schoolId,
-            "roomCount": self.roomCount,
+            "roomCount": roomCount,
+            "totalBeds": totalBeds,
+            "occupiedBeds": occupiedBeds,
         }
         if self.schoolId:
             data["schoolName"] = self.school.name
@@ -648,19 +863,29 @@ class Room(Base):
     building = Column(Text, nullable=True)
     maxBeds = Column(Integer, nullable=True, default=0)  # 统计用，最大床位数
 
+    # 批量统计床位数、已住床位数（有客户的床位）：{roomId: (totalBeds, occupiedBeds)}
+    @staticmethod
+    def occupancyOf(session, roomIds):
+        if not roomIds:
+            return {}
+        rows = session.query(
+            Bed.roomId, func.count(distinct(Bed.id)), func.count(distinct(Client.bedId))
+        ).outerjoin(Client, Client.bedId == Bed.id).filter(
+            Bed.roomId.in_(roomIds)
+        ).group_by(Bed.roomId).all()
+        return {roomId: tuple(counts) for roomId, *counts in rows}
+
     # 已住的床位数
-    # bool(bed.clients) 会把空列表变成 False，非空变成 True，加总起来就是非空床的数量。
-    # sum(True, True, False) => 2，因为 True 就是 1，False 是 0。
     @property
     def occupiedBeds(self):
         session = Session()
-        beds = session.query(Bed).filter(Bed.roomId == self.id).all()
-        if len(beds) != 0:
-            return sum(bool(bed.clients) for bed in beds)
+        occupancy = Room.occupancyOf(session, [self.id]).get(self.id, (0, 0))
         session.close()
-        return 0
+        return occupancy[1]
 
-    def to_json(self):
+    # occupancy 为 occupancyOf 的统计结果，由调用方批量查询后传入
+    def to_json(self, occupancy):
+        totalBeds, occupiedBeds = occupancy
         data = {
             "id": self.id,
             "dormitoryId": self.dormitoryId,
@@ -668,7 +893,8 @@ class Room(Base):
             "roomNumber": self.roomNumber,
             "building": self.building,
             "maxBeds": self.maxBeds,
-            "occupiedBeds": self.occupiedBeds,
+            "totalBeds": totalBeds,
+            "occupiedBeds": occupiedBeds,
         }
         # if self.dormitoryId:
         #     data["dormitory"] = self.dormitory.to_json()
@@ -691,27 +917,41 @@ class Bed(Base):
     def isVacant(self):
         return not self.clients
 
-    def to_json(self):
+    # 床位及当前入住客户一次外连接查出，返回 [(bed, occupant)]，occupant 只含 id、姓名和入住日期
+    # withRoom 时一并加载房间、公寓及所属学校
+    @staticmethod
+    def rosterOf(session, *criteria, withRoom=False):
+        occupant = Bundle("occupant", Client.id, Client.name, Client.bedCheckInDate, Client.bedCheckOutDate)
+        query = session.query(Bed, occupant).outerjoin(Client, Client.bedId == Bed.id) \
+            .filter(*criteria).order_by(Bed.id, Client.id)
+        if withRoom:
+            query = query.options(joinedload(Bed.room).joinedload(Room.dormitory).joinedload(Dormitory.school))
+        roster = {}
+        for bed, client in query:
+            # 同一床位有多位客户时取第一位
+            if bed.id not in roster:
+                roster[bed.id] = (bed, client if client.id else None)
+        return list(roster.values())
+
+    # occupant 为 rosterOf 查出的入住客户（None 表示空床）
+    def to_json(self, occupant):
         data = {
             "id": self.id,
             "roomId": self.roomId,
             "bedNumber": self.bedNumber,
             "category": self.category,
             "duration": self.duration,
-            "isVacant": self.isVacant,
+            "isVacant": occupant is None,
             "studentId": None,
             "studentName": None,
         }
         # if self.roomId:
         #     data["room"] = self.room.to_json()
-        session = Session()
-        client_for_this_bed = session.query(Client).filter(Client.bedId == self.id).first()
-        if client_for_this_bed:
-            data["studentId"] = client_for_this_bed.id
-            data["studentName"] = client_for_this_bed.name
-            data["bedCheckInDate"] = client_for_this_bed.bedCheckInDate
-            data["bedCheckOutDate"] = client_for_this_bed.bedCheckOutDate
-        session.close()
+        if occupant:
+            data["studentId"] = occupant.id
+            data["studentName"] = occupant.name
+            data["bedCheckInDate"] = occupant.bedCheckInDate
+            data["bedCheckOutDate"] = occupant.bedCheckOutDate
         return data
 
 
@@ -723,7 +963,7 @@ class ClientLog(Base):
     operatorId = Column(Integer, ForeignKey("user.id"), nullable=True)
     operator = relationship("User", backref="hisClientLogs")
     operation = Column(Text, nullable=True)
-    time = Column(DateTime, default=datetime.now)
+    time = Column(DateTime, default=datetime.now, index=True)
 
     def to_json(self):
         data = {
@@ -744,7 +984,7 @@ class Log(Base):
     operatorId = Column(Integer, ForeignKey("user.id"), nullable=True)
     operator = relationship("User", backref="logs")
     operation = Column(Text, nullable=True)
-    time = Column(DateTime, default=datetime.now)
+    time = Column(DateTime, default=datetime.now, index=True)
 
     def to_json(self):
         data = {
@@ -760,3 +1000,43 @@ class Log(Base):
 # 创建所有表（被alembic替代）
 if __name__ == "__main__":
     Base.metadata.create_all(bind=engine)
+
+
+# 线索文件导入任务：状态保存在数据库中，多进程部署时任一进程都能查询进度（见 utils/importer.py）
+class ImportJob(Base):
+    __tablename__ = "import_job"
+    id = Column(String(32), primary_key=True)
+    userId = Column(Integer, ForeignKey("user.id"), nullable=False)
+    fileName = Column(Text, nullable=True)
+    # queued / running / done / failed
+    status = Column(String(16), nullable=False, default="queued")
+    total = Column(Integer, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    success = Column(Integer, nullable=False, default=0)
+    error = Column(Integer, nullable=False, default=0)
+    # 逐行失败原因（行号为表格中的行号，表头为第1行）
+    errors = Column(JSON, nullable=True, default=[])
+    message = Column(Text, nullable=True)
+    createdTime = Column(DateTime, default=datetime.now)
+    finishedTime = Column(DateTime, nullable=True, index=True)
+
+    def to_json(self):
+        return {
+            "jobId": self.id,
+            "fileName": self.fileName,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "success": self.success,
+            "error": self.error,
+            "errors": self.errors or [],
+            "message": self.message,
+            "createdTime": self.createdTime,
+        }
+
+
+# 各表的数据版本号：事务提交后对写过的表自增，各进程据此判断缓存是否失效（见 utils/cache.py）
+class TableVersion(Base):
+    __tablename__ = "table_version"
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
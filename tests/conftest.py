@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试使用临时 SQLite 库；config.py 不在仓库中，这里按需提供配置项
+_tempDir = tempfile.mkdtemp(prefix="crm-test-")
+config = types.ModuleType("config")
+config.DATABASE_URI = f"sqlite:///{os.path.join(_tempDir, 'crm.db')}"
+config.LOGIN_SECRET = "test"
+config.OSS_ACCESS_KEY_ID = "test"
+config.OSS_ACCESS_KEY_SECRET = "test"
+config.OSS_BUCKET_NAME = "crm-test"
+config.OSS_ENDPOINT = "oss-cn-hangzhou.aliyuncs.com"
+config.MAX_LOG_LENGTH = 1000
+# 处理函数在当前线程执行、密码直接计算、不启动后台任务
+config.DB_THREADS = 0
+config.PASSWORD_WORKERS = 0
+config.BCRYPT_ROUNDS = 4
+config.SLOW_QUERY_MS = None
+config.RETENTION_INTERVAL = 0
+sys.modules["config"] = config
+
+from models import Base, engine, Session, School, Department, Role, User, Course, CourseCombo, Lesson, Client
+from utils import cache
+from utils.hooks import calcSignature, encode, invalidateUserAuth
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    cache._countCache.clear()
+    cache._referenceCache.clear()
+    cache._sharedVersions.clear()
+    cache._sharedReadAt = None
+    invalidateUserAuth()
+    yield Session
+    engine.dispose()
+
+
+def sessionidOf(userId):
+    signature = calcSignature(userId)
+    return encode(f"userId={userId}&timestamp={int(time.time())}&signature={signature}&algorithm=sha256")
+
+
+class FakeRequest:
+    def __init__(self, body=None, sessionid=None, headers=None):
+        self.body = body
+        self.headers = dict(headers or {})
+        if sessionid:
+            self.headers["sessionid"] = sessionid
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("Invalid JSON object")
+        return self.body
+
+
+# 调用处理函数：JSON 响应解析为 dict，其他响应（文件、304 等）原样返回
+def call(handler, body=None, userId=1, headers=None):
+    response = asyncio.run(handler(FakeRequest(body, sessionidOf(userId) if userId else None, headers)))
+    if response.headers.get("Content-Type") == "application/json" and response.status_code == 200:
+        return json.loads(response.description)
+    return response
+
+
+# 两个校区；admin 可见全部，t1 可见本校区，t2 仅本人，t3 无校区
+def seed(session, clients=30):
+    session.add_all([School(id=1, name="北京"), School(id=2, name="上海")])
+    session.add_all([Department(id=1, name="销售", schoolId=1), Department(id=2, name="教务", schoolId=2)])
+    session.add_all([Role(id=1, name="老师", authority=[5, 6]), Role(id=2, name="店长", authority=[1, 2, 3])])
+    session.add_all([
+        User(id=1, username="admin", usertype=6, status=1, schoolId=1, departmentId=1, vocationId=1, clientVisible=4,
+             hashedPassword=User.hashPassword("12345")),
+        User(id=2, username="t1", usertype=1, status=1, schoolId=1, departmentId=1, vocationId=1, clientVisible=2,
+             hashedPassword=User.hashPassword("12345")),
+        User(id=3, username="t2", usertype=1, status=1, schoolId=2, departmentId=2, vocationId=2, clientVisible=1,
+             hashedPassword=User.hashPassword("12345")),
+        User(id=4, username="t3", usertype=1, status=1, clientVisible=3),
+    ])
+    session.add_all([Course(id=1, name="瑜伽A", schoolId=1, creatorId=1, category=1),
+                     Course(id=2, name="瑜伽B", schoolId=2, creatorId=1, category=2)])
+    session.add(CourseCombo(id=1, name="套餐", price=1999.5, schoolId=1, courseIds=[1, 2]))
+    session.add(Lesson(id=1, name="一班", courseId=1, classTeacherId=2))
+    base = datetime(2025, 1, 1)
+    for i in range(clients):
+        session.add(Client(id=i + 1, name=f"c{i}", phone=f"1380000{i:04d}", weixin=f"wx{i}", fromSource=1,
+                           clientStatus=[1, 2, 3, 4][i % 4], processStatus=1 + i % 2,
+                           creatorId=[1, 2, 3, None][i % 4], appointerId=[None, 2, 3, 99][i % 4],
+                           affiliatedUserId=[None, 2, 3, 1][i % 4],
+                           courseIds=[1, 2] if i % 3 == 0 else ([] if i % 3 == 1 else None),
+                           lessonIds=[1] if i % 5 == 0 else [], comboId=1 if i % 6 == 0 else None,
+                           info=["a", ""], createdTime=base + timedelta(hours=i // 2)))
+    session.commit()
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+
+import pytest
+
+from conftest import seed
+from models import Log
+from utils import audit, metrics
+
+
+@pytest.fixture
+def bufferedAudit(db, monkeypatch):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    monkeypatch.setattr(audit, "AUDIT_MODE", "buffered")
+    monkeypatch.setattr(audit, "AUDIT_FLUSH_MS", 1)
+    monkeypatch.setattr(audit, "AUDIT_RETRIES", 2)
+    return db
+
+
+def logCount(Session):
+    session = Session()
+    count = session.query(Log).count()
+    session.close()
+    return count
+
+
+# 在后台写入任务中提交3条日志，insertRows 前 failures 次调用失败；等到 finished() 成立后停止后台任务
+def writeLogs(Session, monkeypatch, failures, finished):
+    calls = []
+    insertRows = audit._insertRows
+
+    def flakyInsert(session, rows):
+        calls.append(len(rows))
+        if len(calls) <= failures:
+            raise RuntimeError("database unavailable")
+        insertRows(session, rows)
+
+    monkeypatch.setattr(audit, "_insertRows", flakyInsert)
+
+    async def run():
+        await audit.startAudit()
+        session = Session()
+        for i in range(3):
+            audit.addLog(session, 1, f"op{i}")
+        session.commit()
+        session.close()
+        # 等待后台任务完成写入与重试
+        for _ in range(500):
+            if finished():
+                break
+            await asyncio.sleep(0.01)
+        await audit.drainAudit()
+
+    asyncio.run(run())
+    return calls, logCount(Session)
+
+
+def test_audit_write_retries_failed_batch(bufferedAudit, monkeypatch, caplog):
+    dropped = metrics._counters.get("auditRowsDropped", 0)
+    with caplog.at_level(logging.WARNING, logger="crm.audit"):
+        calls, count = writeLogs(bufferedAudit, monkeypatch, failures=2,
+                                 finished=lambda: logCount(bufferedAudit) == 3)
+    assert (calls, count) == ([3, 3, 3], 3)
+    assert metrics._counters.get("auditRowsDropped", 0) == dropped
+    assert [record.exc_info[0] for record in caplog.records] == [RuntimeError, RuntimeError]
+
+
+def test_audit_write_drops_after_retries(bufferedAudit, monkeypatch, caplog):
+    dropped = metrics._counters.get("auditRowsDropped", 0)
+    with caplog.at_level(logging.WARNING, logger="crm.audit"):
+        calls, count = writeLogs(bufferedAudit, monkeypatch, failures=10,
+                                 finished=lambda: metrics._counters.get("auditRowsDropped", 0) > dropped)
+    assert (calls, count) == ([3, 3, 3], 0)
+    assert metrics._counters["auditRowsDropped"] == dropped + 3
+    assert caplog.records[-1].levelno == logging.ERROR
+    assert f"crm_audit_rows_dropped_total {dropped + 3}" in metrics.renderPrometheus()
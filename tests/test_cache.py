@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+from sqlalchemy import text
+
+from bluePrints import department, dorm
+from conftest import FakeRequest, call, seed, sessionidOf
+from models import engine, Dormitory
+from utils import cache
+
+
+# 保留响应头（call 会把 200 的 JSON 响应解析为 dict）
+def raw(handler, body, etag=None):
+    headers = {"If-None-Match": etag} if etag else {}
+    return asyncio.run(handler(FakeRequest(body, sessionidOf(1), headers)))
+
+
+def etagOf(response):
+    return response.headers.get("ETag")
+
+
+def deptNames(response):
+    return [dept["name"] for dept in json.loads(response.description)["depts"]]
+
+
+# 本进程的写入：提交后版本号立即变化，带旧 ETag 的请求拿到新数据
+def test_write_bumps_version_and_next_request_is_200(db):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    first = raw(department.getAllDepts, {})
+    assert first.status_code == 200
+    versions = cache.tableVersions(["department"])
+    assert raw(department.getAllDepts, {}, etagOf(first)).status_code == 304
+
+    assert call(department.addDept, {"name": "市场", "schoolId": 1})["status"] == 200
+    assert cache.tableVersions(["department"]) > versions
+    second = raw(department.getAllDepts, {}, etagOf(first))
+    assert second.status_code == 200
+    assert deptNames(second) == ["销售", "教务", "市场"]
+
+    # 列表接口（versionedResponse）同样失效
+    listed = raw(dorm.getDormitories, {})
+    session = db()
+    session.add(Dormitory(id=1, name="一号楼", schoolId=1))
+    session.commit()
+    session.close()
+    assert raw(dorm.getDormitories, {}, etagOf(listed)).status_code == 200
+
+
+# 其他进程的写入：只更新了共享版本号，本进程在 TABLE_VERSION_REFRESH 秒内读到
+def test_shared_version_invalidates_other_processes(db, monkeypatch):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    first = raw(department.getAllDepts, {})
+
+    def writeFromOtherProcess(name):
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO department (name, `schoolId`) VALUES (:name, 1)"), {"name": name})
+            conn.execute(text("UPDATE table_version SET version = version + 1 WHERE name = 'department'"))
+
+    # 读取间隔内仍按已读到的版本号命中缓存
+    monkeypatch.setattr(cache, "TABLE_VERSION_REFRESH", 3600)
+    writeFromOtherProcess("市场")
+    assert raw(department.getAllDepts, {}, etagOf(first)).status_code == 304
+
+    monkeypatch.setattr(cache, "TABLE_VERSION_REFRESH", 0)
+    second = raw(department.getAllDepts, {}, etagOf(first))
+    assert second.status_code == 200
+    assert deptNames(second) == ["销售", "教务", "市场"]
+    assert raw(department.getAllDepts, {}, etagOf(second)).status_code == 304
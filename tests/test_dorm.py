@@ -0,0 +1,62 @@
+from sqlalchemy import event
+
+from bluePrints import dorm
+from conftest import call, seed
+from models import engine, Bed, Client, Dormitory, Room
+
+
+def seedDorms(session, rooms=2):
+    session.add_all([Dormitory(id=1, name="一号楼", category=1, schoolId=1),
+                     Dormitory(id=2, name="二号楼", category=2, schoolId=2)])
+    for roomId in range(1, rooms + 1):
+        session.add(Room(id=roomId, dormitoryId=1, roomNumber=str(100 + roomId), maxBeds=4))
+        # 每个房间3张床，第一个房间住2人
+        session.add_all([Bed(id=roomId * 10 + n, roomId=roomId, bedNumber=n, category=1) for n in range(1, 4)])
+    session.flush()
+    session.get(Client, 1).bedId = 11
+    session.get(Client, 2).bedId = 12
+    session.commit()
+
+
+def statementsOf(handler, body):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = call(handler, body)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def test_dorm_occupancy(db):
+    session = db()
+    seed(session, clients=3)
+    seedDorms(session)
+    session.close()
+    dormitories = call(dorm.getDormitories, {"pageIndex": 1, "pageSize": 10})["dormitories"]
+    assert [(d["id"], d["roomCount"], d["totalBeds"], d["occupiedBeds"]) for d in dormitories] == \
+        [(1, 2, 6, 2), (2, 0, 0, 0)]
+    rooms = call(dorm.getRooms, {"dormitoryId": 1})["rooms"]
+    assert [(r["id"], r["totalBeds"], r["occupiedBeds"]) for r in rooms] == [(1, 3, 2), (2, 3, 0)]
+    beds = call(dorm.getBeds, {"roomId": 1})["beds"]
+    assert [(b["id"], b["isVacant"], b["studentId"]) for b in beds] == [(11, False, 1), (12, False, 2), (13, True, None)]
+    info = call(dorm.getDormInfoByBedId, {"bedId": 12})
+    assert (info["dorm"]["occupiedBeds"], info["room"]["totalBeds"], info["room"]["occupiedBeds"]) == (2, 3, 2)
+    assert info["bed"]["studentId"] == 2
+
+
+# 统计按页批量查询：语句数与房间数无关
+def test_room_list_statement_count_is_constant(db):
+    session = db()
+    seed(session, clients=3)
+    seedDorms(session, rooms=2)
+    session.close()
+    _, small = statementsOf(dorm.getRooms, {"dormitoryId": 1})
+    session = db()
+    session.add_all([Room(id=roomId, dormitoryId=1, roomNumber=str(100 + roomId)) for roomId in range(3, 9)])
+    session.commit()
+    session.close()
+    rooms, large = statementsOf(dorm.getRooms, {"dormitoryId": 1})
+    assert len(rooms["rooms"]) == 8
+    assert small == large
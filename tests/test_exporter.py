@@ -0,0 +1,30 @@
+import csv
+
+import pytest
+from openpyxl import load_workbook
+
+from utils import exporter
+
+VALUES = ["=1+1", "+SUM(A1:A9)", "-2+3", "@cmd", "\t=x", "\r=x", "+8613800000000", "-5", "普通文本", ["=a", "b"], 3]
+ESCAPED = ["'=1+1", "'+SUM(A1:A9)", "'-2+3", "'@cmd", "'\t=x", "'\r=x", "+8613800000000", "-5", "普通文本", "'=a，b", 3]
+
+
+def readBack(path):
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return list(csv.reader(f))
+    workbook = load_workbook(path)
+    try:
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+# 以 = + - @ 等开头的文本加单引号，打开文件时不会被当作公式执行；+86 开头的电话、负数保持原样
+@pytest.mark.parametrize("fileFormat", ["csv", "xlsx"])
+def test_export_escapes_formula_prefixes(fileFormat, tmp_path, monkeypatch):
+    monkeypatch.setattr(exporter, "EXPORT_DIR", str(tmp_path))
+    path = exporter.writeExport(fileFormat, [f"列{i}" for i in range(len(VALUES))], iter([VALUES]))
+    header, row = readBack(path)
+    expected = [str(value) for value in ESCAPED] if fileFormat == "csv" else ESCAPED
+    assert row == expected
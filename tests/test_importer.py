@@ -0,0 +1,151 @@
+import pytest
+from sqlalchemy import event, text
+
+from bluePrints.extra import importStatus
+from conftest import call, seed
+from models import engine, Client, ClientContact
+from utils import importer
+from utils.importer import importClues, insertedClientIds
+
+
+def clueRows(count):
+    return [{"* 姓名": f"n{i}", "* 微信": f"imp{i}", "电话": f"150{i:08d}", "性别": "男", "年龄": "20"}
+            for i in range(count)]
+
+
+def countStatements(func):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def contactsMatchClients(session):
+    rows = session.query(ClientContact.kind, ClientContact.value, Client).join(
+        Client, Client.id == ClientContact.clientId).all()
+    return all(getattr(client, kind) == value for kind, value, client in rows)
+
+
+@pytest.fixture(params=["returning", "readBack"])
+def insertPath(request, monkeypatch):
+    # MySQL 不支持 RETURNING：在 SQLite 上关闭该能力，走按微信取回id的路径
+    if request.param == "readBack":
+        monkeypatch.setattr(engine.dialect, "insert_executemany_returning", False)
+    return request.param
+
+
+def test_import_clues_checks_duplicates_and_row_errors(db, insertPath):
+    session = db()
+    seed(session, clients=5)
+    rows = clueRows(20)
+    rows[3]["* 微信"] = "wx1"  # 与已有客户重复（MySQL 排序规则下大小写、末尾空格不同也算重复，SQLite 按原值比较）
+    rows[5]["电话"] = rows[4]["电话"]  # 本批内重复
+    rows[6]["* 姓名"] = ""  # 缺必填
+    rows[7]["年龄"] = "abc"  # 格式错误
+    success, errors = importClues(session, rows, 1, rowOffset=1)
+    session.commit()
+    assert success == 16
+    assert errors == [
+        {"row": 5, "message": "存在微信相同的客户"},
+        {"row": 7, "message": "与第6行的电话重复"},
+        {"row": 8, "message": "未添线索姓名或微信"},
+        {"row": 9, "message": "数据格式错误：invalid literal for int() with base 10: 'abc'"},
+    ]
+    assert session.query(Client).count() == 21
+    assert session.query(ClientContact).filter(ClientContact.kind == "weixin").count() == 16
+    assert contactsMatchClients(session)
+    session.close()
+
+
+# 每个唯一字段一次 IN 查询：语句数与行数无关
+def test_import_clues_statement_count_is_constant(db, insertPath):
+    session = db()
+    seed(session, clients=0)
+    _, small = countStatements(lambda: importClues(session, clueRows(10), 1))
+    session.rollback()
+    _, large = countStatements(lambda: importClues(session, clueRows(500), 1))
+    session.rollback()
+    session.close()
+    assert small == large
+
+
+def test_inserted_client_ids_read_back(db):
+    session = db()
+    seed(session, clients=3)
+    session.add(Client(id=10, name="dup", weixin="wx1"))
+    session.commit()
+    # 同一微信取最新插入的一条，取不到的为 None
+    assert insertedClientIds(session, [{"weixin": "wx0"}, {"weixin": "wx1"}, {"weixin": "missing"}]) == [1, 10, None]
+    session.close()
+
+
+# 库中保存的值与写入值不一致（如排序规则不同）时，该行不写联系方式索引，整批仍然成功
+def test_import_clues_survives_unreadable_ids(db, monkeypatch):
+    monkeypatch.setattr(engine.dialect, "insert_executemany_returning", False)
+    session = db()
+    seed(session, clients=0)
+    session.execute(text("CREATE TRIGGER rewrite AFTER INSERT ON client WHEN NEW.weixin = 'imp2' "
+                         "BEGIN UPDATE client SET weixin = 'IMP2-stored' WHERE id = NEW.id; END"))
+    success, errors = importClues(session, clueRows(5), 1)
+    session.commit()
+    assert (success, errors) == (5, [])
+    assert session.query(ClientContact).filter(ClientContact.kind == "weixin").count() == 4
+    assert contactsMatchClients(session)
+    session.close()
+
+
+def runJob(userId, fileName, fileData):
+    jobId = importer.submitImport(userId, fileName, fileData)
+    # 导入线程为单线程：排在其后的空任务完成时导入已结束
+    importer._executor.submit(lambda: None).result()
+    return jobId
+
+
+@pytest.fixture
+def importDir(tmp_path, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_SIZE", 3)
+    return tmp_path
+
+
+# GBK 编码的 CSV（Excel 默认导出）按批导入，任务状态写入数据库，上传的文件处理后删除
+def test_import_job_gb18030_csv(db, importDir):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    lines = ["* 姓名,* 微信,电话,性别,年龄",
+             "张三,wxa,15000000001,男,20",
+             "李四,wxb,15000000002,女,",
+             "王五,wxc,15000000001,男,30",  # 与第2行电话重复（同一批内）
+             "赵六,wxd,15000000004,女,abc",  # 格式错误（第二批）
+             "钱七,wxe,15000000005,女,25"]
+    jobId = runJob(1, "线索.csv", "\r\n".join(lines).encode("gb18030"))
+    job = importer.getImportJob(jobId)
+    # CSV 不预先统计总行数
+    assert (job.status, job.total, job.processed, job.success, job.error) == ("done", None, 5, 3, 2)
+    assert job.errors == [
+        {"row": 4, "message": "与第2行的电话重复"},
+        {"row": 5, "message": "数据格式错误：invalid literal for int() with base 10: 'abc'"},
+    ]
+    session = db()
+    assert sorted(name for (name,) in session.query(Client.name)) == ["张三", "李四", "钱七"]
+    session.close()
+    assert list(importDir.iterdir()) == []
+    assert call(importStatus, {"jobId": jobId})["job"]["success"] == 3
+    # 其他用户查不到该任务
+    assert call(importStatus, {"jobId": jobId}, userId=2)["status"] == 404
+
+
+def test_import_job_failure_removes_file(db, importDir):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    jobId = runJob(1, "broken.xlsx", b"not a workbook")
+    job = importer.getImportJob(jobId)
+    assert job.status == "failed" and job.finishedTime is not None
+    assert job.message.startswith("导入失败：")
+    assert list(importDir.iterdir()) == []
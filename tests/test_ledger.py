@@ -0,0 +1,216 @@
+import random
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from bluePrints import department, extra, user as userBlueprint
+from conftest import call, seed
+from models import Payment, SchoolLedger, User
+from utils.ledger import adjustLedger, adjustRollup, applyPayment
+
+START = date(2025, 1, 1)
+RANGES = [("2025-01-10", "2025-01-20"), ("2024-01-01", "2026-12-31"), ("2025-02-01", "2025-02-01"),
+          ("2025-03-05", "2025-04-01")]
+
+
+@pytest.fixture
+def payments(db):
+    session = db()
+    seed(session, clients=10)
+    rng = random.Random(1)
+    for i in range(200):
+        payment = Payment(clientId=1 + i % 10, teacherId=rng.choice([1, 2, 3, 4]), amount=rng.randint(-500, 1000),
+                          category=1 + i % 3, paymentMethod=1 + i % 2,
+                          paymentDate=START + timedelta(days=rng.randint(0, 60)))
+        session.add(payment)
+        session.flush()
+        applyPayment(session, payment)
+    session.commit()
+    session.close()
+    return db
+
+
+# 原实现：扫描校区全部交易记录累加
+def fullScanBudget(Session, schoolId, startDate, endDate):
+    session = Session()
+    rows = session.query(Payment.paymentDate, Payment.amount).join(Payment.teacher).filter(
+        User.schoolId == schoolId).all()
+    session.close()
+    startDate, endDate = date.fromisoformat(startDate), date.fromisoformat(endDate)
+    before = sum(amount for day, amount in rows if day < startDate)
+    income = sum(amount for day, amount in rows if startDate <= day <= endDate and amount > 0)
+    expense = sum(amount for day, amount in rows if startDate <= day <= endDate and amount < 0)
+    return before, income, expense, before + income + expense
+
+
+def assertBudgetsMatch(Session):
+    today = date.today().isoformat()
+    for schoolId in (1, 2):
+        for startDate, endDate in RANGES + [(today, today)]:
+            data = call(department.calcSchoolBudget,
+                        {"schoolId": schoolId, "startDate": startDate, "endDate": endDate})["data"]
+            assert (data["budgetBefore"], data["incomeDuring"], data["expanseDuring"], data["budgetAfter"]) \
+                == fullScanBudget(Session, schoolId, startDate, endDate), (schoolId, startDate, endDate)
+
+
+def closingBalances(Session, schoolId):
+    session = Session()
+    rows = dict(session.query(SchoolLedger.date, SchoolLedger.closingBalance).filter(
+        SchoolLedger.schoolId == schoolId))
+    session.close()
+    return rows
+
+
+def test_budget_matches_full_scan_after_payment_changes(payments):
+    assertBudgetsMatch(payments)
+    assert call(extra.addPayment, {"clientId": 1, "teacherId": 2, "amount": "300", "category": 1,
+                                   "paymentMethod": 1, "receiver": "x", "info": ""})["status"] == 200
+    assert call(extra.submitPayment, {"clientId": 1, "teacherId": 3, "amount": "-120", "category": 2,
+                                      "paymentMethod": 1, "info": ""})["status"] == 200
+    assertBudgetsMatch(payments)
+    session = payments()
+    paymentId = session.query(Payment.id).filter(Payment.teacherId == 2).order_by(Payment.id).first()[0]
+    session.close()
+    # 改金额并换到另一校区的老师
+    assert call(extra.updatePayment, {"id": paymentId, "clientId": 1, "teacherId": 3, "amount": "777", "category": 1,
+                                      "paymentMethod": 1, "receiver": "x", "info": ""})["status"] == 200
+    assertBudgetsMatch(payments)
+    assert call(extra.deletePayment, {"id": paymentId + 1})["status"] == 200
+    assertBudgetsMatch(payments)
+
+
+# 补录早于已有台账的交易：之后每天的结余都要顺延
+def test_back_dated_payment_shifts_later_closing_balances(payments):
+    day = START + timedelta(days=20)
+    before = closingBalances(payments, 1)
+    session = payments()
+    payment = Payment(clientId=1, teacherId=2, amount=450, category=1, paymentMethod=1, paymentDate=day)
+    session.add(payment)
+    session.flush()
+    applyPayment(session, payment)
+    session.commit()
+    session.close()
+    after = closingBalances(payments, 1)
+    assert {d: after[d] - before.get(d, 0) for d in after if d >= day} == {d: 450 for d in after if d >= day}
+    assert {d: after[d] for d in after if d < day} == {d: before[d] for d in before if d < day}
+    assertBudgetsMatch(payments)
+
+
+# 老师调校区后两个校区的台账都按交易记录重建
+def test_budget_matches_full_scan_after_school_move(payments):
+    assert call(userBlueprint.updateUser, {"id": 2, "schoolId": 2})["status"] == 200
+    assertBudgetsMatch(payments)
+
+
+# 原实现：按交易记录逐笔汇总，维度与交易汇总表一致（未填写的类别、方式记为0）
+def fullScanSummary(Session, granularity):
+    session = Session()
+    rows = session.query(Payment.paymentDate, User.schoolId, Payment.category, Payment.paymentMethod,
+                         Payment.amount).join(Payment.teacher).filter(User.schoolId.isnot(None)).all()
+    session.close()
+    summary = {}
+    for day, schoolId, category, paymentMethod, amount in rows:
+        if granularity == "month":
+            period = day.strftime("%Y-%m")
+        elif granularity == "week":
+            period = (day - timedelta(days=day.weekday())).isoformat()
+        else:
+            period = day.isoformat()
+        item = summary.setdefault((period, schoolId, category or 0, paymentMethod or 0), [0, 0, 0])
+        item[0 if amount > 0 else 1] += amount
+        item[2] += 1
+    return [{"period": period, "schoolId": schoolId, "category": category, "paymentMethod": paymentMethod,
+             "income": income, "expense": expense, "net": income + expense, "count": count}
+            for (period, schoolId, category, paymentMethod), (income, expense, count) in sorted(summary.items())]
+
+
+def assertSummariesMatch(Session):
+    for granularity in ("day", "week", "month"):
+        result = call(extra.getPaymentSummary, {"granularity": granularity,
+                                                "groupBy": ["schoolId", "category", "paymentMethod"]})
+        expected = fullScanSummary(Session, granularity)
+        assert result["summary"] == expected, granularity
+        assert result["total"] == {"income": sum(item["income"] for item in expected),
+                                   "expense": sum(item["expense"] for item in expected),
+                                   "count": sum(item["count"] for item in expected)}
+
+
+def test_payment_summary_matches_full_scan_after_payment_changes(payments):
+    assertSummariesMatch(payments)
+    assert call(extra.addPayment, {"clientId": 1, "teacherId": 2, "amount": "300", "category": None,
+                                   "paymentMethod": 2, "receiver": "x", "info": ""})["status"] == 200
+    assertSummariesMatch(payments)
+    session = payments()
+    paymentId = session.query(Payment.id).filter(Payment.teacherId == 2).order_by(Payment.id).first()[0]
+    session.close()
+    # 改金额正负、类别并换到另一校区的老师
+    assert call(extra.updatePayment, {"id": paymentId, "clientId": 1, "teacherId": 3, "amount": "-50", "category": 3,
+                                      "paymentMethod": 1, "receiver": "x", "info": ""})["status"] == 200
+    assertSummariesMatch(payments)
+    assert call(extra.deletePayment, {"id": paymentId + 1})["status"] == 200
+    assertSummariesMatch(payments)
+    assert call(userBlueprint.updateUser, {"id": 2, "schoolId": 2})["status"] == 200
+    assertSummariesMatch(payments)
+
+
+# _upsert 按方言生成的语句：唯一键冲突时在已有行上累加
+class FakeSession:
+    def __init__(self, dialectName):
+        self.dialect = SimpleNamespace(name=dialectName)
+        self.statements = []
+
+    def get_bind(self):
+        return self
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+UPSERT_SQL = {
+    "mysql": "INSERT INTO payment_rollup (`schoolId`, date, category, `paymentMethod`, income, expense, count) "
+             "VALUES (%s, %s, %s, %s, %s, %s, %s) "
+             "ON DUPLICATE KEY UPDATE income = (payment_rollup.income + %s), count = (payment_rollup.count + %s)",
+    "sqlite": 'INSERT INTO payment_rollup ("schoolId", date, category, "paymentMethod", income, expense, count) '
+              "VALUES (?, ?, ?, ?, ?, ?, ?) "
+              'ON CONFLICT ("schoolId", date, category, "paymentMethod") '
+              "DO UPDATE SET income = (payment_rollup.income + ?), count = (payment_rollup.count + ?)",
+    "postgresql": 'INSERT INTO payment_rollup ("schoolId", date, category, "paymentMethod", income, expense, count) '
+                  "VALUES (%(schoolId)s, %(date)s, %(category)s, %(paymentMethod)s, %(income)s, %(expense)s, "
+                  "%(count)s) "
+                  'ON CONFLICT ("schoolId", date, category, "paymentMethod") '
+                  "DO UPDATE SET income = (payment_rollup.income + %(income_1)s), "
+                  "count = (payment_rollup.count + %(count_1)s) RETURNING payment_rollup.id",
+}
+DIALECTS = {"mysql": mysql.dialect(), "sqlite": sqlite.dialect(), "postgresql": postgresql.dialect()}
+
+
+@pytest.mark.parametrize("dialectName", ["mysql", "sqlite", "postgresql"])
+def test_upsert_statement_per_dialect(dialectName):
+    session = FakeSession(dialectName)
+    adjustRollup(session, 1, date(2025, 1, 2), None, 2, 300, 1)
+    compiled = session.statements[0].compile(dialect=DIALECTS[dialectName])
+    assert str(compiled) == UPSERT_SQL[dialectName]
+    assert [value for value in compiled.params.values()] == [1, date(2025, 1, 2), 0, 2, 300, 0, 1, 300, 1]
+
+
+LEDGER_CONFLICT_SQL = {
+    "mysql": "ON DUPLICATE KEY UPDATE expense = (school_ledger.expense + %s), "
+             "`closingBalance` = (school_ledger.`closingBalance` + %s)",
+    "sqlite": 'ON CONFLICT ("schoolId", date) DO UPDATE SET expense = (school_ledger.expense + ?), '
+              '"closingBalance" = (school_ledger."closingBalance" + ?)',
+    "postgresql": 'ON CONFLICT ("schoolId", date) DO UPDATE SET expense = (school_ledger.expense + %(expense_1)s), '
+                  '"closingBalance" = (school_ledger."closingBalance" + %(closingBalance_1)s)',
+}
+
+
+# 台账：冲突键为 (schoolId, date)；撤销一笔支出时从支出列扣回，新行的期初接上一天结余（这里为100）
+@pytest.mark.parametrize("dialectName", ["mysql", "sqlite", "postgresql"])
+def test_ledger_upsert_statement_per_dialect(dialectName):
+    session = FakeSession(dialectName)
+    session.execute = lambda statement: session.statements.append(statement) or SimpleNamespace(scalar=lambda: 100)
+    adjustLedger(session, 1, date(2025, 1, 2), -40, sign=-1)
+    compiled = session.statements[1].compile(dialect=DIALECTS[dialectName])
+    assert LEDGER_CONFLICT_SQL[dialectName] in str(compiled)
+    assert [value for value in compiled.params.values()] == [1, date(2025, 1, 2), 0, 40, 140, 40, 40]
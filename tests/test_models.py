@@ -0,0 +1,21 @@
+from conftest import seed
+from models import Client
+
+
+def test_bulk_to_json_matches_to_json(db):
+    session = db()
+    seed(session)
+    clients = session.query(Client).order_by(Client.id).all()
+    assert Client.bulk_to_json(clients, session) == [client.to_json() for client in clients]
+    session.close()
+
+
+# 归属人没有校区时，逐条 to_json 会因 None.name 抛出 AttributeError，批量序列化返回空校区
+def test_bulk_to_json_affiliated_user_without_school(db):
+    session = db()
+    seed(session, clients=0)
+    session.add(Client(id=1, name="c", weixin="wx", affiliatedUserId=4, creatorId=4))
+    session.commit()
+    data = Client.bulk_to_json([session.get(Client, 1)], session)[0]
+    assert (data["schoolId"], data["schoolName"], data["affiliatedUserName"]) == (None, "", "t3")
+    session.close()
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import call, seed
+from bluePrints.extra import getClueClients, getClients, getDealedClients
+from models import Client
+
+
+def offsetIds(handler, pageSize):
+    ids, pageIndex = [], 1
+    while True:
+        page = call(handler, {"pageIndex": pageIndex, "pageSize": pageSize, "skipTotal": 1})["clients"]
+        if not page:
+            return ids
+        ids += [client["id"] for client in page]
+        pageIndex += 1
+
+
+def cursorIds(handler, pageSize):
+    ids, cursor = [], ""
+    while cursor is not None:
+        res = call(handler, {"cursor": cursor, "pageSize": pageSize, "skipTotal": 1})
+        ids += [client["id"] for client in res["clients"]]
+        cursor = res["nextCursor"]
+    return ids
+
+
+# createdTime 相同（部分 clientStatus 也相同）时，游标分页与页码分页的顺序须一致
+@pytest.mark.parametrize("handler", [getClueClients, getClients, getDealedClients])
+def test_cursor_pages_match_offset_pages_on_ties(db, handler):
+    session = db()
+    seed(session, clients=0)
+    tied = datetime(2025, 3, 1, 9)
+    session.add_all([Client(id=i, name=f"c{i}", weixin=f"wx{i}", clientStatus=[3, 4, 3][i % 3], processStatus=2,
+                            affiliatedUserId=1, createdTime=tied if i % 2 else datetime(2025, 3, i % 5 + 1))
+                     for i in range(1, 24)])
+    session.commit()
+    session.close()
+    expected = offsetIds(handler, 4)
+    assert len(expected) == 23
+    assert cursorIds(handler, 4) == expected
@@ -0,0 +1,30 @@
+import asyncio
+import sys
+import types
+
+from utils import passwords
+
+
+# 子进程不重新执行服务的主模块，只导入 utils.passwordWorker
+def test_password_workers_do_not_import_main(tmp_path, monkeypatch):
+    marker = tmp_path / "imported"
+    script = tmp_path / "fakeApp.py"
+    script.write_text(f"open({str(marker)!r}, 'w').close()\nimport models\n")
+    main = types.ModuleType("__main__")
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    monkeypatch.setattr(passwords, "PASSWORD_WORKERS", 1)
+    monkeypatch.setattr(passwords, "_pool", None)
+    hashedPassword = passwords.hashPasswordSync("12345")
+
+    async def run():
+        return await passwords.checkPassword("12345", hashedPassword), await passwords.checkPassword("x", hashedPassword)
+
+    try:
+        assert asyncio.run(run()) == (True, False)
+        modules = passwords._pool.submit(eval, "[name for name in ('config', 'models', 'sqlalchemy') "
+                                               "if name in __import__('sys').modules]").result()
+    finally:
+        passwords._pool.shutdown()
+    assert modules == []
+    assert not marker.exists()
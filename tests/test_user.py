@@ -0,0 +1,35 @@
+import json
+
+from bluePrints import user as userBlueprint
+from conftest import call, seed
+from models import Log, User
+
+
+def operationsOf(Session, userId):
+    session = Session()
+    operations = [operation for (operation,) in session.query(Log.operation).filter(Log.operatorId == userId)]
+    session.close()
+    return operations
+
+
+# 校验密码期间会话已关闭，登录日志另开会话写入
+def test_login_writes_log(db):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    assert call(userBlueprint.login, {"username": "t1", "password": "wrong"}, userId=None)["status"] == -2
+    result = call(userBlueprint.login, {"username": "t1", "password": "12345"}, userId=None)
+    assert result["status"] == 200 and result["sessionid"]
+    assert operationsOf(db, 2) == ["用户登录"]
+
+
+def test_modify_password(db):
+    session = db()
+    seed(session, clients=0)
+    session.close()
+    form = json.dumps({"oldPwd": "12345", "newPwd": "54321"})
+    assert call(userBlueprint.modifyPwd, {"form": form}, userId=2)["status"] == 200
+    session = db()
+    assert session.get(User, 2).checkPassword("54321")
+    session.close()
+    assert operationsOf(db, 2) == ["修改密码"]
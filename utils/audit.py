@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import event, insert
+
+import config
+from models import ClientLog, Log, Session
+from utils.metrics import incrementCounter
+
+# 操作日志写入方式：
+# transactional —— 随业务事务提交，提交前一次批量 INSERT；
+# buffered —— 业务事务提交后放入队列，由后台任务每 AUDIT_FLUSH_MS 毫秒或攒够 AUDIT_FLUSH_ROWS 条批量写入，
+#             不占用业务事务的耗时和锁，但进程异常退出时可能丢失尚未写入的日志
+AUDIT_MODE = getattr(config, "AUDIT_MODE", "transactional")
+AUDIT_FLUSH_MS = getattr(config, "AUDIT_FLUSH_MS", 200)
+AUDIT_FLUSH_ROWS = getattr(config, "AUDIT_FLUSH_ROWS", 500)
+# 后台写入失败（如数据库短暂不可用）时同一批的重试次数，仍失败则丢弃并计入 crm_audit_rows_dropped_total
+AUDIT_RETRIES = getattr(config, "AUDIT_RETRIES", 3)
+
+logger = logging.getLogger("crm.audit")
+
+
+def _pending(session):
+    return session.info.setdefault("auditRows", [])
+
+
+# 记录操作日志，随 session 提交写入
+def addLog(session, operatorId, operation):
+    _pending(session).append((Log, {"operatorId": operatorId, "operation": operation, "time": datetime.now()}))
+
+
+# 记录客户日志
+def addClientLog(session, clientId, operatorId, operation):
+    addClientLogs(session, [clientId], operatorId, operation)
+
+
+# 批量操作：每个客户一条相同内容的日志
+def addClientLogs(session, clientIds, operatorId, operation):
+    now = datetime.now()
+    _pending(session).extend((ClientLog, {"clientId": clientId, "operatorId": operatorId, "operation": operation,
+                                          "time": now}) for clientId in clientIds)
+
+
+# 按表分组，每张表一条 executemany
+def _insertRows(session, rows):
+    for model in (Log, ClientLog):
+        values = [row for rowModel, row in rows if rowModel is model]
+        if values:
+            session.execute(insert(model), values)
+
+
+@event.listens_for(Session, "before_commit")
+def _writeInTransaction(session):
+    if AUDIT_MODE == "buffered" or not session.info.get("auditRows"):
+        return
+    # 先写入业务数据，日志可能引用本事务中新建的记录
+    session.flush()
+    _insertRows(session, session.info.pop("auditRows"))
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueueAfterCommit(session):
+    rows = session.info.pop("auditRows", None)
+    if rows:
+        _enqueue(rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discardOnRollback(session):
+    session.info.pop("auditRows", None)
+
+
+# 后台写入：队列和写入任务绑定在服务的事件循环上
+_queue = None
+_loop = None
+_writer = None
+# 写入任务正在攒批的日志
+_batch = []
+
+
+# 写入一批日志，返回是否成功
+def _writeRows(rows):
+    session = Session()
+    try:
+        _insertRows(session, rows)
+        session.commit()
+        return True
+    except Exception:
+        session.rollback()
+        logger.warning("操作日志写入失败（%d条）", len(rows), exc_info=True)
+        return False
+    finally:
+        session.close()
+
+
+def _dropRows(rows):
+    logger.error("操作日志写入多次失败，已丢弃%d条", len(rows))
+    incrementCounter("auditRowsDropped", len(rows))
+
+
+# 不重试的写入路径（直接写入、服务关闭时写出剩余日志）
+def _writeOrDrop(rows):
+    if not _writeRows(rows):
+        _dropRows(rows)
+
+
+async def _writeLoop():
+    global _batch
+    loop = asyncio.get_running_loop()
+    while True:
+        _batch = await _queue.get()
+        deadline = loop.time() + AUDIT_FLUSH_MS / 1000
+        while len(_batch) < AUDIT_FLUSH_ROWS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                _batch += await asyncio.wait_for(_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+        rows, _batch = _batch, []
+        # 数据库写入是阻塞调用，放到线程池执行；失败时等待后重试同一批，间隔逐次加倍
+        for attempt in range(AUDIT_RETRIES + 1):
+            if await loop.run_in_executor(None, _writeRows, rows):
+                break
+            if attempt == AUDIT_RETRIES:
+                _dropRows(rows)
+                break
+            # 等待期间服务关闭时由 drainAudit 写出
+            _batch = rows
+            await asyncio.sleep(AUDIT_FLUSH_MS / 1000 * 2 ** attempt)
+            rows, _batch = _batch, []
+
+
+def _enqueue(rows):
+    if _writer is None or _loop.is_closed():
+        # 未启动后台任务（命令行脚本、buffered 以外的模式等）：直接写入
+        _writeOrDrop(rows)
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _queue.put_nowait(rows)
+    else:
+        # 处理函数在线程池中执行，经由服务的事件循环入队
+        _loop.call_soon_threadsafe(_queue.put_nowait, rows)
+
+
+# 在服务的事件循环中启动后台写入任务（服务启动时调用）
+async def startAudit():
+    global _queue, _loop, _writer
+    if AUDIT_MODE == "buffered" and _writer is None:
+        _queue, _loop = asyncio.Queue(), asyncio.get_running_loop()
+        _writer = _loop.create_task(_writeLoop())
+
+
+# 停止后台任务并写出尚未写入的日志（服务关闭时调用）
+async def drainAudit():
+    global _batch, _writer
+    if _writer is None:
+        return
+    _writer.cancel()
+    _writer = None
+    rows, _batch = _batch, []
+    while not _queue.empty():
+        rows += _queue.get_nowait()
+    if rows:
+        await asyncio.get_running_loop().run_in_executor(None, _writeOrDrop, rows)
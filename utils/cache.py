@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.util import find_tables
+
+import config
+from models import Session, TableVersion, engine
+
+# 计数缓存有效期（秒），为0则不缓存；表版本号失效之外再加一层有效期兜底
+COUNT_CACHE_TTL = getattr(config, "COUNT_CACHE_TTL", 30)
+COUNT_CACHE_SIZE = 4096
+# 其他进程写入后，本进程最多经过多少秒读到新的版本号（缓存、ETag 随之失效）；为0则每次都读
+TABLE_VERSION_REFRESH = getattr(config, "TABLE_VERSION_REFRESH", 1)
+
+logger = logging.getLogger("crm.cache")
+
+# 表版本号：事务提交时对写过的表自增，缓存条目记录取数时的版本号，版本变化即失效。
+# 本进程的计数立即生效；table_version 表中的计数在各进程间共享，按 TABLE_VERSION_REFRESH 定期读取
+_tableVersions = {}
+_sharedVersions = {}
+_sharedReadAt = None
+_lock = threading.Lock()
+_refreshLock = threading.Lock()
+
+
+def _refreshShared():
+    global _sharedVersions, _sharedReadAt
+    now = time.monotonic()
+    if _sharedReadAt is not None and now - _sharedReadAt < TABLE_VERSION_REFRESH:
+        return
+    with _refreshLock:
+        if _sharedReadAt is not None and time.monotonic() - _sharedReadAt < TABLE_VERSION_REFRESH:
+            return
+        try:
+            with engine.connect() as conn:
+                _sharedVersions = dict(conn.execute(select(TableVersion.name, TableVersion.version)).all())
+        except Exception:
+            logger.warning("读取表版本号失败，其他进程的写入暂时只能靠缓存有效期失效", exc_info=True)
+        _sharedReadAt = time.monotonic()
+
+
+def tableVersions(tables):
+    _refreshShared()
+    return tuple((_sharedVersions.get(table, 0), _tableVersions.get(table, 0)) for table in tables)
+
+
+# 共享计数自增；表第一次写入时补建版本行（多个进程同时补建时主键冲突，改为自增）
+def _bumpShared(tables):
+    tables = sorted(tables)
+    with engine.begin() as conn:
+        statement = update(TableVersion).where(TableVersion.name.in_(tables)) \
+            .values(version=TableVersion.version + 1)
+        if conn.execute(statement).rowcount == len(tables):
+            return
+        existing = set(conn.execute(select(TableVersion.name).where(TableVersion.name.in_(tables))).scalars())
+    for table in tables:
+        if table in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(TableVersion).values(name=table, version=1))
+        except IntegrityError:
+            with engine.begin() as conn:
+                conn.execute(update(TableVersion).where(TableVersion.name == table)
+                             .values(version=TableVersion.version + 1))
+
+
+def bumpTables(tables):
+    with _lock:
+        for table in tables:
+            _tableVersions[table] = _tableVersions.get(table, 0) + 1
+    try:
+        _bumpShared(tables)
+    except Exception:
+        logger.warning("更新表版本号失败（%s），其他进程的缓存要到有效期后才失效", ", ".join(sorted(tables)),
+                       exc_info=True)
+
+
+def _touched(session):
+    return session.info.setdefault("touchedTables", set())
+
+
+# ORM 对象的增删改
+@event.listens_for(Session, "after_flush")
+def _recordFlush(session, flushContext):
+    touched = _touched(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        touched.add(obj.__table__.name)
+
+
+# query.update() / query.delete() 等批量语句
+@event.listens_for(Session, "do_orm_execute")
+def _recordBulk(ormExecuteState):
+    if ormExecuteState.is_insert or ormExecuteState.is_update or ormExecuteState.is_delete:
+        _touched(ormExecuteState.session).add(ormExecuteState.statement.table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bumpOnCommit(session):
+    touched = session.info.pop("touchedTables", None)
+    if touched:
+        bumpTables(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discardOnRollback(session):
+    session.info.pop("touchedTables", None)
+
+
+# 分页总数缓存：key 为去掉排序后的 SQL 及参数（已包含筛选条件与可见范围）
+_countCache = {}
+
+
+def cachedCount(query):
+    query = query.order_by(None)
+    statement = query.statement
+    if not COUNT_CACHE_TTL:
+        return query.count()
+    compiled = statement.compile(dialect=query.session.get_bind().dialect)
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    tables = sorted({table.name for table in find_tables(statement, include_joins=True, include_aliases=True)})
+    # 先取版本号再计数，计数期间有写入时下次会重新计数
+    versions = tableVersions(tables)
+    now = time.monotonic()
+    entry = _countCache.get(key)
+    if entry and entry[0] > now and entry[1] == versions:
+        return entry[2]
+    total = query.count()
+    with _lock:
+        if len(_countCache) >= COUNT_CACHE_SIZE:
+            _countCache.pop(next(iter(_countCache)))
+        _countCache[key] = (now + COUNT_CACHE_TTL, versions, total)
+    return total
+
+
+# 基础数据（校区、部门、课程、套餐、职位、权限）接口的响应缓存：按所依赖表的版本号失效，
+# 命中时直接返回序列化好的响应，不查询业务表；有效期用于兜底版本号读写失败的情况
+REFERENCE_CACHE_TTL = getattr(config, "REFERENCE_CACHE_TTL", 300)
+REFERENCE_CACHE_SIZE = 1024
+_referenceCache = {}
+
+
+def cachedResponse(key, tables, loader):
+    if not REFERENCE_CACHE_TTL:
+        return loader()
+    versions = tableVersions(tables)
+    now = time.monotonic()
+    entry = _referenceCache.get(key)
+    if entry and entry[0] > now and entry[1] == versions:
+        return entry[2]
+    response = loader()
+    with _lock:
+        if len(_referenceCache) >= REFERENCE_CACHE_SIZE:
+            _referenceCache.pop(next(iter(_referenceCache)))
+        _referenceCache[key] = (now + REFERENCE_CACHE_TTL, versions, response)
+    return response
@@ -0,0 +1,38 @@
+import json
+from datetime import date, datetime
+
+import orjson
+from robyn import Headers, Response
+
+import config
+
+
+def _orjsonDumps(data):
+    # 允许非字符串的键（如按 id 分组的统计结果）
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+# 日期统一输出 ISO 8601：date 为 "2025-01-01"，datetime 为 "2025-01-01T08:30:00"（有微秒时带微秒），与 orjson 一致
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# 标准库编码器：仅在排查 orjson 兼容问题时使用，编码器对象复用
+_stdlibEncoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def _stdlibDumps(data):
+    return _stdlibEncoder.encode(data).encode("utf-8")
+
+
+ENCODERS = {"orjson": _orjsonDumps, "json": _stdlibDumps}
+# 响应编码器：可配置为上面的名称，或直接配置一个 data -> bytes 的函数
+JSON_ENCODER = getattr(config, "JSON_ENCODER", "orjson")
+dumps = JSON_ENCODER if callable(JSON_ENCODER) else ENCODERS[JSON_ENCODER]
+
+
+# 替代 robyn.jsonify：直接以 bytes 作为响应体，省去 jsonify 先解码成 str、Robyn 再编码回 bytes 的两次拷贝
+def jsonify(data):
+    return Response(status_code=200, headers=Headers({"Content-Type": "application/json"}), description=dumps(data))
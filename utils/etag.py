@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import time
+
+from robyn import Headers, Response
+
+import config
+from utils.cache import cachedResponse, tableVersions
+
+# 按表版本号生成的 ETag 含本进程的计数，只在本进程内有效：带上进程标识，重启后或其他进程生成的 ETag 不会误判为未修改；
+# 其他进程的写入经共享版本号在 TABLE_VERSION_REFRESH 秒内感知（见 utils.cache）。版本号读写失败时，
+# ETAG_TTL 秒后 ETag 自动更换，客户端重新取一次完整数据（为0则不更换）
+ETAG_TTL = getattr(config, "ETAG_TTL", 300)
+_processTag = os.urandom(4).hex()
+
+
+def makeETag(data):
+    return 'W/"' + hashlib.blake2b(data, digest_size=8).hexdigest() + '"'
+
+
+def _matches(request, etag):
+    value = request.headers.get("If-None-Match")
+    if not value:
+        return False
+    return value.strip() == "*" or etag in (tag.strip() for tag in value.split(","))
+
+
+def _headers(etag):
+    # 跨域时前端需要读到 ETag 才能在下次请求中带上 If-None-Match
+    return Headers({"ETag": etag, "Access-Control-Expose-Headers": "ETag"})
+
+
+def notModified(etag):
+    return Response(status_code=304, headers=_headers(etag), description="")
+
+
+def etagResponse(request, etag, body):
+    if _matches(request, etag):
+        return notModified(etag)
+    headers = _headers(etag)
+    headers.set("Content-Type", "application/json")
+    return Response(status_code=200, headers=headers, description=body)
+
+
+# 基础数据接口：响应整体缓存（见 utils.cache.cachedResponse），ETag 取响应内容的摘要，缓存时一并算好
+def referenceResponse(request, key, tables, loader):
+    def load():
+        body = loader().description
+        return body, makeETag(body)
+
+    body, etag = cachedResponse(key, tables, load)
+    return etagResponse(request, etag, body)
+
+
+# 列表接口：取数前按所依赖表的版本号生成 ETag，与客户端一致时直接返回 304，不查询、不序列化
+def versionedResponse(request, key, tables, loader):
+    epoch = int(time.time() // ETAG_TTL) if ETAG_TTL else 0
+    etag = makeETag(repr((_processTag, epoch, key, tableVersions(tables))).encode("utf-8"))
+    if _matches(request, etag):
+        return notModified(etag)
+    return etagResponse(request, etag, loader().description)
+
+
+# 接口均为 POST，同一地址不同参数返回不同数据：请求体按键排序后作为 key 的一部分
+def paramsKey(data):
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
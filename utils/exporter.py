@@ -0,0 +1,86 @@
+import csv
+import os
+import time
+import uuid
+from datetime import datetime
+
+from openpyxl import Workbook
+from robyn.responses import serve_file
+
+import config
+
+# 导出文件：逐行写入 temp 目录下的文件再整体下载，内存中只保留当前一批数据；
+# Robyn 不支持分块流式响应，因此先落盘再由 serve_file 发送：首字节要等文件写完，并占用与文件等大的磁盘空间。
+# 文件含身份证号、手机号等信息，超过保留时间（秒）后由定时清理任务（utils.retention）删除，导出时也顺带清理
+EXPORT_DIR = "./temp/exports"
+EXPORT_FORMATS = ("csv", "xlsx")
+EXPORT_BATCH_SIZE = getattr(config, "EXPORT_BATCH_SIZE", 1000)
+EXPORT_FILE_TTL = 3600
+
+
+# 删除过期的导出文件，返回删除的文件数
+def purgeExports():
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    now = time.time()
+    removed = 0
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > EXPORT_FILE_TTL:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+# 单元格取值：列表合并为一格；CSV 中时间去掉微秒；
+# 以 = + - @ 开头的文本会被表格软件当作公式执行，前面加单引号按文本显示（+86 等纯数字除外）
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cellValue(value, fileFormat):
+    if isinstance(value, list):
+        value = "，".join(str(item) for item in value if item not in (None, ""))
+    if isinstance(value, str):
+        if value[:1] in _FORMULA_PREFIXES and not value[1:].isdigit():
+            return "'" + value
+    elif fileFormat == "csv" and isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+# 写出表头和逐行数据，返回文件路径；rows 为可迭代对象，逐行消费
+def writeExport(fileFormat, header, rows):
+    if fileFormat not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式：{fileFormat}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    purgeExports()
+    path = os.path.join(EXPORT_DIR, f"{uuid.uuid4().hex}.{fileFormat}")
+    rows = ([_cellValue(value, fileFormat) for value in row] for row in rows)
+    try:
+        if fileFormat == "csv":
+            # 带 BOM，Excel 直接打开时中文不乱码
+            with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            # 只写模式：行数据直接写入临时文件，不在内存中保留整张表
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(header)
+            for row in rows:
+                sheet.append(row)
+            workbook.save(path)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+def exportResponse(path, prefix):
+    fileName = f"{prefix}_{datetime.now().strftime('%Y%m%d%H%M%S')}{os.path.splitext(path)[1]}"
+    return serve_file(os.path.abspath(path), fileName)
@@ -7,8 +7,14 @@ import time
 import yagmail
 import random
 
-from config import LOGIN_SECRET, MAX_LOG_LENGTH
-from models import User, Log, Session
+from sqlalchemy import or_, select, true
+
+import config
+from config import LOGIN_SECRET
+from models import User, Role, Session, Client, Payment
+
+# 权限缓存有效期（秒），为0则只依赖主动失效
+AUTH_CACHE_TTL = getattr(config, "AUTH_CACHE_TTL", 60)
 
 
 # from models import *
@@ -67,54 +73,118 @@ def checkSessionid(sessionid):
     }
 
 
-def checkAdminOnly(userId, operationLevel="adminOnly"):
+class UserAuth:
+    __slots__ = ("usertype", "authority", "clientVisible", "schoolId", "departmentId", "expireAt")
+
+    def __init__(self, usertype, authority, clientVisible, schoolId, departmentId):
+        self.usertype = usertype
+        self.authority = frozenset(authority or [])
+        self.clientVisible = clientVisible
+        self.schoolId = schoolId
+        self.departmentId = departmentId
+        self.expireAt = time.monotonic() + AUTH_CACHE_TTL if AUTH_CACHE_TTL else None
+
+
+# 权限缓存：userId -> UserAuth（用户类型、职位权限、线索可见范围）
+_authCache = {}
+
+
+def getUserAuth(userId):
+    auth = _authCache.get(userId)
+    if auth is not None and (auth.expireAt is None or auth.expireAt > time.monotonic()):
+        return auth
     session = Session()
     try:
-        user = session.query(User).get(userId)
-        if not user:
-            return False
-        usertype = user.usertype
-        if operationLevel == "adminOnly":
-            return usertype == 2 or usertype == 6
-        elif operationLevel == "superAdminOnly":
-            return usertype == 6
-        else:
-            return True
+        # 用户与职位一次查出，不再懒加载 user.vocation
+        row = session.query(User.usertype, Role.authority, User.clientVisible, User.schoolId, User.departmentId) \
+            .outerjoin(Role, User.vocationId == Role.id).filter(User.id == userId).first()
+        if not row:
+            _authCache.pop(userId, None)
+            return None
+        auth = _authCache[userId] = UserAuth(*row)
+        return auth
     finally:
         session.close()
 
 
+# 用户信息、职位权限变动后清除权限缓存；不传userId则全部清除
+def invalidateUserAuth(userId=None):
+    if userId is None:
+        _authCache.clear()
+    else:
+        _authCache.pop(int(userId), None)
+
+
+def checkAdminOnly(userId, operationLevel="adminOnly"):
+    auth = getUserAuth(userId)
+    if not auth:
+        return False
+    usertype = auth.usertype
+    if operationLevel == "adminOnly":
+        return usertype == 2 or usertype == 6
+    elif operationLevel == "superAdminOnly":
+        return usertype == 6
+    else:
+        return True
+
+
 def checkUserAuthority(userId, authorityId):
-    session = Session()
-    try:
-        user = session.query(User).get(userId)
-        if not user:
-            return False
-        # admin豁免
-        if user.usertype >= 2:
-            return True
-        authority = user.authority
-        if authorityId in authority:
-            return True
+    auth = getUserAuth(userId)
+    if not auth:
         return False
-    finally:
-        session.close()
+    # admin豁免
+    if auth.usertype >= 2:
+        return True
+    return authorityId in auth.authority
 
 
 def checkUserVisibleClient(userId):
-    session = Session()
-    try:
-        user = session.query(User).get(userId)
-        if not user or not user.clientVisible:
-            return [0, None, None]
-        res = [user.clientVisible, user.schoolId, user.departmentId]
-        # admin豁免
-        if user.usertype >= 2:
-            res[0] = 4
-            return res
-        return res
-    finally:
-        session.close()
+    auth = getUserAuth(userId)
+    if not auth or not auth.clientVisible:
+        return [0, None, None]
+    # admin豁免
+    if auth.usertype >= 2:
+        return [4, auth.schoolId, auth.departmentId]
+    return [auth.clientVisible, auth.schoolId, auth.departmentId]
+
+
+def _teacherIdsOfScope(tag, schoolId, deptId):
+    match tag:
+        case 2:  # 本校区
+            return select(User.id).where(User.schoolId == schoolId)
+        case 3:  # 本部门
+            return select(User.id).where(User.departmentId == deptId)
+
+
+# 线索可见范围的SQL条件（子查询，不把老师id取回Python）；返回None表示未限定范围
+def clientVisibleFilter(userId):
+    tag, schoolId, deptId = checkUserVisibleClient(userId)
+    match tag:
+        case 1:  # 本人相关
+            return or_(Client.affiliatedUserId == userId, Client.creatorId == userId, Client.appointerId == userId)
+        case 2 | 3:  # 本校区 / 本部门
+            teacherIds = _teacherIdsOfScope(tag, schoolId, deptId)
+            return or_(Client.affiliatedUserId.in_(teacherIds), Client.creatorId.in_(teacherIds),
+                       Client.appointerId.in_(teacherIds))
+        case 4:  # 全部
+            return true()
+        case _:
+            return None
+
+
+# 交易记录可见范围的SQL条件；返回None表示未限定范围
+def paymentVisibleFilter(userId):
+    tag, schoolId, deptId = checkUserVisibleClient(userId)
+    match tag:
+        case 1:  # 本人相关
+            return Payment.clientId.in_(select(Client.id).where(
+                or_(Client.creatorId == userId, Client.appointerId == userId, Client.affiliatedUserId == userId)))
+        case 2 | 3:  # 本校区 / 本部门
+            return Payment.teacherId.in_(_teacherIdsOfScope(tag, schoolId, deptId))
+        case 4:  # 全部
+            return true()
+        case _:
+            return None
 
 
 def generateCaptcha():
@@ -122,21 +192,3 @@ def generateCaptcha():
     captcha = random.sample(source, 6)
     captcha = "".join(captcha)
     return captcha
-
-
-def clearLogs():
-    session = Session()
-    try:
-        log_count = session.query(Log).count()
-        if log_count > MAX_LOG_LENGTH:
-            delete_count = log_count - MAX_LOG_LENGTH
-            subquery = (
-                session.query(Log.id)
-                .order_by(Log.time.asc())
-                .limit(delete_count)
-                .subquery()
-            )
-            session.query(Log).filter(Log.id.in_(subquery)).delete(synchronize_session=False)
-            # session.commit()
-    finally:
-        session.close()
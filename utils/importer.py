@@ -0,0 +1,309 @@
+import codecs
+import csv
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from openpyxl import load_workbook
+from sqlalchemy import delete, insert, select, update
+
+import config
+from models import Client, ClientContact, ImportJob, Session
+
+# 唯一字段及其中文名称
+UNIQUE_FIELDS = {
+    "phone": "电话",
+    "weixin": "微信",
+    "QQ": "QQ",
+    "douyin": "抖音",
+    "rednote": "小红书",
+    "shangwutong": "商务通"
+}
+# IN 查询每批的取值个数
+IN_CHUNK_SIZE = 1000
+# 文件导入：每批行数（每批一个事务）、任务报告中保留的错误条数、已结束任务的保留时间（秒）
+IMPORT_CHUNK_SIZE = getattr(config, "IMPORT_CHUNK_SIZE", 1000)
+MAX_REPORTED_ERRORS = 1000
+JOB_TTL = 3600
+IMPORT_DIR = "./temp"
+
+
+# 导入表格的一行 -> 客户字段
+def clueFromRow(row, userId):
+    return {
+        "name": row.get("* 姓名", ""),
+        "gender": 1 if row.get("性别") == "男" else 2 if row.get("性别") == "女" else None,
+        "age": int(row.get("年龄", 0)) if row.get("年龄") else None,
+        "IDNumber": row.get("身份证", ""),
+        "phone": row.get("电话", ""),
+        "weixin": row.get("* 微信", ""),
+        "QQ": row.get("QQ", ""),
+        "douyin": row.get("抖音", ""),
+        "rednote": row.get("小红书", ""),
+        "shangwutong": row.get("商务通", ""),
+        "address": row.get("地区", ""),
+        "info": [row.get("备注", "")],
+        "clientStatus": 1,  # 线索状态
+        "creatorId": userId
+    }
+
+
+# 查重用的比较键：与 MySQL 默认排序规则一致，忽略大小写和末尾空格
+def valueKey(value):
+    return str(value).rstrip(" ").lower()
+
+
+# 数据库中已存在的取值（每个字段一次 IN 查询，按批拆分），返回比较键集合
+def existingValues(session, column, values):
+    values = list(values)
+    existing = set()
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        chunk = values[start:start + IN_CHUNK_SIZE]
+        existing.update(valueKey(value) for (value,) in session.execute(select(column).where(column.in_(chunk))))
+    return existing
+
+
+# 不支持 RETURNING 时（MySQL）按微信取回新客户id（微信已保证唯一），同一微信取最新插入的一条：
+# 先按原值匹配，再按比较键匹配；库中排序规则（如 utf8mb4_general_ci 对全角、重音字符）与比较键不一致时逐条查询，不因个别行整批失败
+def insertedClientIds(session, clues):
+    weixins = [clue["weixin"] for clue in clues]
+    exact, normalized = {}, {}
+    for start in range(0, len(weixins), IN_CHUNK_SIZE):
+        chunk = weixins[start:start + IN_CHUNK_SIZE]
+        for clientId, weixin in session.execute(
+                select(Client.id, Client.weixin).where(Client.weixin.in_(chunk)).order_by(Client.id)):
+            exact[weixin] = clientId
+            normalized[valueKey(weixin)] = clientId
+    clientIds = []
+    for weixin in weixins:
+        clientId = exact.get(weixin) or normalized.get(valueKey(weixin))
+        if clientId is None:
+            clientId = session.execute(select(Client.id).where(Client.weixin == weixin)
+                                       .order_by(Client.id.desc()).limit(1)).scalar()
+        clientIds.append(clientId)
+    return clientIds
+
+
+# 批量导入线索：先整批查重，再一次性 INSERT；返回 (成功条数, 逐行错误)
+# rowOffset 为本批第一行在整个导入中的序号偏移，用于错误报告中的行号
+def importClues(session, rows, userId, rowOffset=0):
+    errors = []
+    clues = []
+    for index, row in enumerate(rows, start=rowOffset + 1):
+        try:
+            clue = clueFromRow(row, userId)
+        except Exception as e:
+            errors.append({"row": index, "message": f"数据格式错误：{str(e)}"})
+            continue
+        # 验证必填字段
+        if not clue["name"] or not clue["weixin"]:
+            errors.append({"row": index, "message": "未添线索姓名或微信"})
+            continue
+        clues.append((index, clue))
+
+    # 每个唯一字段只查一次数据库
+    existing = {
+        field: existingValues(session, getattr(Client, field), {clue[field] for _, clue in clues if clue[field]})
+        for field in UNIQUE_FIELDS
+    }
+    # 本批内已出现的取值 -> 行号
+    seen = {field: {} for field in UNIQUE_FIELDS}
+    newClues = []
+    for index, clue in clues:
+        error = None
+        for field, fieldName in UNIQUE_FIELDS.items():
+            if not clue[field]:  # 只检查非空字段
+                continue
+            value = valueKey(clue[field])
+            if value in existing[field]:
+                error = f"存在{fieldName}相同的客户"
+                break
+            if value in seen[field]:
+                error = f"与第{seen[field][value]}行的{fieldName}重复"
+                break
+        if error:
+            errors.append({"row": index, "message": error})
+            continue
+        for field in UNIQUE_FIELDS:
+            if clue[field]:
+                seen[field][valueKey(clue[field])] = index
+        newClues.append(clue)
+
+    if newClues:
+        # 取回新客户id，批量写入联系方式索引表：支持 RETURNING 的数据库（SQLite、PostgreSQL、MariaDB）由插入语句直接返回，
+        # 返回的是写入的原值，按原值对应，与排序规则无关（不要求按参数顺序返回，否则 SQLite 会逐行插入）
+        if session.get_bind().dialect.insert_executemany_returning:
+            ids = {weixin: clientId for clientId, weixin in
+                   session.execute(insert(Client).returning(Client.id, Client.weixin), newClues)}
+            clientIds = [ids.get(clue["weixin"]) for clue in newClues]
+        else:
+            session.execute(insert(Client), newClues)
+            clientIds = insertedClientIds(session, newClues)
+        contacts = [{"clientId": clientId, "kind": kind, "value": str(clue[kind])[:ClientContact.VALUE_LENGTH]}
+                    for clientId, clue in zip(clientIds, newClues) if clientId
+                    for kind in ClientContact.KINDS if clue[kind]]
+        if contacts:
+            session.execute(insert(ClientContact), contacts)
+    errors.sort(key=lambda error: error["row"])
+    return len(newClues), errors
+
+
+# 表格单元格 -> 字符串（Excel 中的手机号等会被读成数字）
+def _cellText(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+# 检测 CSV 编码：广告平台导出的文件常为 GBK
+def _csvEncoding(path):
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def _iterCsv(path):
+    with open(path, newline="", encoding=_csvEncoding(path)) as f:
+        reader = csv.reader(f)
+        header = [_cellText(cell) for cell in next(reader, [])]
+        for values in reader:
+            yield dict(zip(header, (_cellText(value) for value in values)))
+
+
+def _iterXlsx(path):
+    # 只读模式逐行读取，不把整个工作簿载入内存
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_cellText(cell) for cell in next(rows, ())]
+        for values in rows:
+            if not any(value is not None for value in values):
+                continue
+            yield dict(zip(header, (_cellText(value) for value in values)))
+    finally:
+        workbook.close()
+
+
+def _countRows(path):
+    if path.endswith(".xlsx"):
+        workbook = load_workbook(path, read_only=True)
+        try:
+            maxRow = workbook.active.max_row
+        finally:
+            workbook.close()
+        return maxRow - 1 if maxRow else None
+    return None
+
+
+# 导入任务在后台线程串行执行，任务状态写入 import_job 表：多个服务进程时，查询进度的请求落到哪个进程都能查到
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clueImport")
+
+
+def _updateJob(jobId, **values):
+    session = Session()
+    try:
+        session.execute(update(ImportJob).where(ImportJob.id == jobId).values(**values))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _removeFile(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _runImport(jobId, userId, path, iterRows):
+    progress = {"processed": 0, "success": 0, "error": 0, "errors": []}
+    try:
+        _updateJob(jobId, status="running", total=_countRows(path))
+        chunk = []
+        rowNumber = 1  # 表头
+        for row in iterRows(path):
+            chunk.append(row)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                _importChunk(jobId, userId, progress, chunk, rowNumber)
+                rowNumber += len(chunk)
+                chunk = []
+        if chunk:
+            _importChunk(jobId, userId, progress, chunk, rowNumber)
+        _updateJob(jobId, status="done", finishedTime=datetime.now(),
+                   message=f"导入完成：成功{progress['success']}条，失败{progress['error']}条")
+    except Exception as e:
+        _updateJob(jobId, status="failed", finishedTime=datetime.now(),
+                   message=f"导入失败：{str(e)}（已成功导入{progress['success']}条）")
+    finally:
+        _removeFile(path)
+
+
+# 每批单独一个事务，失败只影响当前批；每批结束后写入进度
+def _importChunk(jobId, userId, progress, chunk, rowOffset):
+    session = Session()
+    try:
+        success, errors = importClues(session, chunk, userId, rowOffset=rowOffset)
+        session.commit()
+        failed = len(errors)
+    except Exception as e:
+        session.rollback()
+        success, failed = 0, len(chunk)
+        errors = [{"row": rowOffset + 1,
+                   "message": f"第{rowOffset + 1}-{rowOffset + len(chunk)}行导入失败：{str(e)}"}]
+    finally:
+        session.close()
+    progress["processed"] += len(chunk)
+    progress["success"] += success
+    progress["error"] += failed
+    progress["errors"] = progress["errors"] + errors[:MAX_REPORTED_ERRORS - len(progress["errors"])]
+    _updateJob(jobId, **progress)
+
+
+_readers = {".csv": _iterCsv, ".xlsx": _iterXlsx}
+
+
+# 保存上传的文件并提交后台导入，立即返回任务id
+def submitImport(userId, fileName, fileData):
+    ext = os.path.splitext(fileName)[1].lower()
+    iterRows = _readers.get(ext)
+    if not iterRows:
+        raise ValueError("仅支持 .xlsx 或 .csv 文件")
+    jobId = uuid.uuid4().hex
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_DIR, f"import_{jobId}{ext}")
+    with open(path, "wb") as f:
+        f.write(fileData)
+    session = Session()
+    try:
+        # 清理过期任务
+        session.execute(delete(ImportJob).where(ImportJob.finishedTime < datetime.now() - timedelta(seconds=JOB_TTL)))
+        session.add(ImportJob(id=jobId, userId=userId, fileName=fileName, status="queued",
+                              processed=0, success=0, error=0, errors=[]))
+        session.commit()
+        _executor.submit(_runImport, jobId, userId, path, iterRows)
+    except Exception:
+        session.rollback()
+        # 任务未能提交，上传的文件不会再被处理
+        _removeFile(path)
+        raise
+    finally:
+        session.close()
+    return jobId
+
+
+def getImportJob(jobId):
+    session = Session()
+    try:
+        return session.get(ImportJob, jobId) if jobId else None
+    finally:
+        session.close()
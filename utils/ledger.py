@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from models import Payment, PaymentRollup, SchoolLedger, Session, User, School
+
+
+def teacherSchoolId(session, teacherId):
+    if not teacherId:
+        return None
+    return session.execute(select(User.schoolId).where(User.id == teacherId)).scalar()
+
+
+# 插入一行，唯一键已存在时改为按 updates 更新（MySQL：ON DUPLICATE KEY UPDATE，其他：ON CONFLICT DO UPDATE）
+# 同校区同一天的第一笔交易并发写入时，后到的一方累加到已有行上，不会因唯一约束冲突而失败
+_INSERTS = {"mysql": mysql.insert, "postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _upsert(session, model, keys, values, updates):
+    dialectName = session.get_bind().dialect.name
+    statement = _INSERTS[dialectName](model).values(**keys, **values)
+    if dialectName == "mysql":
+        statement = statement.on_duplicate_key_update(**updates)
+    else:
+        statement = statement.on_conflict_do_update(index_elements=list(keys), set_=updates)
+    session.execute(statement)
+
+
+# 调整校区日台账：sign 为1计入、-1撤销该笔金额
+def adjustLedger(session, schoolId, day, amount, sign=1):
+    if not schoolId or not day or not amount:
+        return
+    # 收入、支出按原金额的正负区分，撤销时从对应列中扣回
+    column = "income" if amount > 0 else "expense"
+    amount = amount * sign
+    # 当天第一笔插入新行，期初余额接上一天的结余；已有当天的行则在其上累加
+    _upsert(session, SchoolLedger, {"schoolId": schoolId, "date": day},
+            {"income": 0, "expense": 0, column: amount,
+             "closingBalance": ledgerBalanceBefore(session, schoolId, day) + amount},
+            {column: getattr(SchoolLedger, column) + amount,
+             "closingBalance": SchoolLedger.closingBalance + amount})
+    # 之后每天的结余都要顺延
+    session.execute(update(SchoolLedger).where(SchoolLedger.schoolId == schoolId, SchoolLedger.date > day)
+                    .values(closingBalance=SchoolLedger.closingBalance + amount))
+
+
+# 汇总维度取值：未填写的类别、方式记为0（唯一约束中 NULL 不参与比较）
+def rollupKey(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+# 调整交易汇总：sign 为1计入、-1撤销
+def adjustRollup(session, schoolId, day, category, paymentMethod, amount, sign):
+    if not schoolId or not day:
+        return
+    column = "income" if (amount or 0) > 0 else "expense"
+    amount = (amount or 0) * sign
+    _upsert(session, PaymentRollup,
+            {"schoolId": schoolId, "date": day, "category": rollupKey(category),
+             "paymentMethod": rollupKey(paymentMethod)},
+            {"income": 0, "expense": 0, column: amount, "count": sign},
+            {column: getattr(PaymentRollup, column) + amount, "count": PaymentRollup.count + sign})
+
+
+# 交易记录增删改时同步台账和汇总：新增/修改后传 sign=1，删除/修改前传 sign=-1
+def applyPayment(session, payment, sign=1):
+    schoolId = teacherSchoolId(session, payment.teacherId)
+    adjustLedger(session, schoolId, payment.paymentDate, payment.amount, sign)
+    adjustRollup(session, schoolId, payment.paymentDate, payment.category, payment.paymentMethod,
+                 payment.amount, sign)
+
+
+# 某天之前（不含）的累计余额：读一行快照
+def ledgerBalanceBefore(session, schoolId, day):
+    closing = session.execute(select(SchoolLedger.closingBalance).where(
+        SchoolLedger.schoolId == schoolId, SchoolLedger.date < day
+    ).order_by(SchoolLedger.date.desc()).limit(1)).scalar()
+    return closing or 0
+
+
+# 按交易记录重建某校区台账（老师调校区后、或数据修复时使用）
+def rebuildSchoolLedger(session, schoolId):
+    session.execute(delete(SchoolLedger).where(SchoolLedger.schoolId == schoolId))
+    days = session.execute(
+        select(Payment.paymentDate,
+               func.coalesce(func.sum(case((Payment.amount > 0, Payment.amount), else_=0)), 0),
+               func.coalesce(func.sum(case((Payment.amount < 0, Payment.amount), else_=0)), 0))
+        .join(User, Payment.teacherId == User.id)
+        .where(User.schoolId == schoolId, Payment.paymentDate.isnot(None))
+        .group_by(Payment.paymentDate).order_by(Payment.paymentDate)
+    ).all()
+    rows = []
+    closing = 0
+    for day, income, expense in days:
+        closing += int(income) + int(expense)
+        rows.append({"schoolId": schoolId, "date": day, "income": int(income), "expense": int(expense),
+                     "closingBalance": closing})
+    if rows:
+        session.execute(insert(SchoolLedger), rows)
+
+
+# 汇总的时间粒度与可选的分组维度
+SUMMARY_PERIODS = ("day", "week", "month")
+SUMMARY_DIMENSIONS = ("schoolId", "category", "paymentMethod")
+
+
+def _periodOf(day, granularity):
+    if granularity == "month":
+        return day.strftime("%Y-%m")
+    if granularity == "week":
+        # 以周一所在日期表示该周
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return day.isoformat()
+
+
+# 从交易汇总表统计收支：schoolId 为 None 表示全部校区；先按日期+维度在库内聚合，再按粒度归并
+def paymentSummary(session, schoolId, startDate, endDate, granularity="month", groupBy=()):
+    dimensions = [getattr(PaymentRollup, name) for name in SUMMARY_DIMENSIONS if name in groupBy]
+    query = select(PaymentRollup.date, *dimensions, func.sum(PaymentRollup.income),
+                   func.sum(PaymentRollup.expense), func.sum(PaymentRollup.count))
+    if schoolId:
+        query = query.where(PaymentRollup.schoolId == schoolId)
+    if startDate:
+        query = query.where(PaymentRollup.date >= startDate)
+    if endDate:
+        query = query.where(PaymentRollup.date <= endDate)
+    # 交易全部撤销后汇总行计数为0，不参与统计
+    query = query.where(PaymentRollup.count > 0).group_by(PaymentRollup.date, *dimensions)
+
+    summary = {}
+    for row in session.execute(query):
+        day, values, (income, expense, count) = row[0], tuple(row[1:-3]), row[-3:]
+        key = (_periodOf(day, granularity),) + values
+        item = summary.setdefault(key, [0, 0, 0])
+        item[0] += int(income or 0)
+        item[1] += int(expense or 0)
+        item[2] += int(count or 0)
+    names = [column.key for column in dimensions]
+    return [dict(zip(["period"] + names, key), income=income, expense=expense, net=income + expense, count=count)
+            for key, (income, expense, count) in sorted(summary.items())]
+
+
+# 按交易记录重建某校区的交易汇总
+def rebuildPaymentRollup(session, schoolId):
+    session.execute(delete(PaymentRollup).where(PaymentRollup.schoolId == schoolId))
+    category = func.coalesce(Payment.category, 0)
+    paymentMethod = func.coalesce(Payment.paymentMethod, 0)
+    groups = session.execute(
+        select(Payment.paymentDate, category, paymentMethod,
+               func.coalesce(func.sum(case((Payment.amount > 0, Payment.amount), else_=0)), 0),
+               func.coalesce(func.sum(case((Payment.amount <= 0, Payment.amount), else_=0)), 0),
+               func.count(Payment.id))
+        .join(User, Payment.teacherId == User.id)
+        .where(User.schoolId == schoolId, Payment.paymentDate.isnot(None))
+        .group_by(Payment.paymentDate, category, paymentMethod)
+    ).all()
+    rows = [{"schoolId": schoolId, "date": day, "category": category, "paymentMethod": paymentMethod,
+             "income": int(income), "expense": int(expense), "count": count}
+            for day, category, paymentMethod, income, expense, count in groups]
+    if rows:
+        session.execute(insert(PaymentRollup), rows)
+
+
+# 重建全部校区台账和交易汇总：python -m utils.ledger
+if __name__ == "__main__":
+    session = Session()
+    try:
+        for (schoolId,) in session.execute(select(School.id)):
+            rebuildSchoolLedger(session, schoolId)
+            rebuildPaymentRollup(session, schoolId)
+            print(f"校区{schoolId}台账、交易汇总已重建")
+        session.commit()
+    finally:
+        session.close()
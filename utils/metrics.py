@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from sqlalchemy import event
+
+from models import engine
+
+# 每个路由保留最近的采样数，用于计算分位数
+SAMPLE_WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 当前请求的统计对象（contextvar 可跟随 asyncio.to_thread 传递到线程中）
+currentRequest = ContextVar("currentRequest", default=None)
+
+
+class RequestStats:
+    __slots__ = ("route", "dbTime", "statements", "rows")
+
+    def __init__(self, route):
+        self.route = route
+        self.dbTime = 0.0
+        self.statements = 0
+        self.rows = 0
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.count = 0
+        # 指标名 -> [累计值, 最近采样]
+        self.series = {
+            "duration": [0.0, deque(maxlen=SAMPLE_WINDOW)],
+            "db": [0.0, deque(maxlen=SAMPLE_WINDOW)],
+            "statements": [0, deque(maxlen=SAMPLE_WINDOW)],
+            "rows": [0, deque(maxlen=SAMPLE_WINDOW)],
+        }
+
+    def observe(self, **values):
+        self.count += 1
+        for name, value in values.items():
+            entry = self.series[name]
+            entry[0] += value
+            entry[1].append(value)
+
+
+_routes = {}
+_lock = threading.Lock()
+# 请求之外的事件计数（后台任务等）：名称 -> 累计值
+_counters = {}
+
+
+def observe(stats, wallTime):
+    with _lock:
+        metrics = _routes.get(stats.route)
+        if metrics is None:
+            metrics = _routes[stats.route] = RouteMetrics()
+        metrics.observe(duration=wallTime, db=stats.dbTime, statements=stats.statements, rows=stats.rows)
+
+
+def incrementCounter(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def instrument(endpoint, handler):
+    if iscoroutinefunction(handler):
+        @wraps(handler)
+        async def wrapper(*args, **kwargs):
+            stats = RequestStats(endpoint)
+            token = currentRequest.set(stats)
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                currentRequest.reset(token)
+                observe(stats, time.perf_counter() - start)
+    else:
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            stats = RequestStats(endpoint)
+            token = currentRequest.set(stats)
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                currentRequest.reset(token)
+                observe(stats, time.perf_counter() - start)
+    return wrapper
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    if currentRequest.get() is not None:
+        conn.info.setdefault("metricsStart", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    stats = currentRequest.get()
+    starts = conn.info.get("metricsStart")
+    if stats is None or not starts:
+        return
+    stats.dbTime += time.perf_counter() - starts.pop()
+    stats.statements += 1
+    # 服务端游标（stream_results / yield_per）此时尚未读取结果，rowcount 无意义（pymysql 返回 2^64-1），
+    # 由读取方调用 countRows 计入
+    if context is not None and context.execution_options.get("stream_results"):
+        return
+    # 只统计有结果集的语句（SELECT），rowcount 对 UPDATE/DELETE 表示影响行数
+    if cursor.description is not None and cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+# 流式读取时按实际读到的行数计入当前请求
+def countRows(count):
+    stats = currentRequest.get()
+    if stats is not None:
+        stats.rows += count
+
+
+def _quantile(sortedValues, q):
+    if not sortedValues:
+        return 0
+    return sortedValues[min(len(sortedValues) - 1, int(q * len(sortedValues)))]
+
+
+_families = (
+    ("duration", "crm_request_duration_seconds", "Wall time of the route handler in seconds"),
+    ("db", "crm_request_db_seconds", "Time spent executing SQL per request in seconds"),
+    ("statements", "crm_request_sql_statements", "SQL statements executed per request"),
+    ("rows", "crm_request_sql_rows", "Rows fetched by SELECT statements per request"),
+)
+_counterFamilies = (
+    ("auditRowsDropped", "crm_audit_rows_dropped_total", "Audit log rows dropped after failed background writes"),
+)
+
+
+# Prometheus 文本格式（summary：p50/p95/p99 取自最近 SAMPLE_WINDOW 次请求）
+def renderPrometheus():
+    with _lock:
+        snapshot = {route: (metrics.count, {name: (entry[0], sorted(entry[1]))
+                                            for name, entry in metrics.series.items()})
+                    for route, metrics in _routes.items()}
+        counters = dict(_counters)
+    lines = []
+    for name, family, helpText in _families:
+        lines.append(f"# HELP {family} {helpText}")
+        lines.append(f"# TYPE {family} summary")
+        for route in sorted(snapshot):
+            count, series = snapshot[route]
+            total, samples = series[name]
+            for q in QUANTILES:
+                lines.append(f'{family}{{route="{route}",quantile="{q}"}} {_quantile(samples, q)}')
+            lines.append(f'{family}_sum{{route="{route}"}} {total}')
+            lines.append(f'{family}_count{{route="{route}"}} {count}')
+    for name, family, helpText in _counterFamilies:
+        lines.append(f"# HELP {family} {helpText}")
+        lines.append(f"# TYPE {family} counter")
+        lines.append(f"{family} {counters.get(name, 0)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,66 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, or_, false
+
+from utils.hooks import encode, decode
+
+
+# 游标分页（keyset）：keys 为 [(排序列, 是否降序)]，最后一列须唯一（一般为主键id）
+# 游标记录上一页最后一行的排序值，下一页用 WHERE 条件直接定位，不再 OFFSET 扫描跳过的行
+# NULL 的排序位置按 MySQL 规则：升序排在最前，降序排在最后
+
+
+def _after(column, desc, value):
+    if desc:
+        if value is None:
+            return false()
+        return or_(column < value, column.is_(None))
+    if value is None:
+        return column.isnot(None)
+    return column > value
+
+
+def _seekFilter(keys, values):
+    (column, desc), value = keys[0], values[0]
+    after = _after(column, desc, value)
+    if len(keys) == 1:
+        return after
+    equal = column.is_(None) if value is None else column == value
+    return or_(after, and_(equal, _seekFilter(keys[1:], values[1:])))
+
+
+def encodeCursor(keys, row):
+    values = []
+    for column, _ in keys:
+        value = getattr(row, column.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return encode(json.dumps(values))
+
+
+def decodeCursor(keys, cursor):
+    try:
+        values = json.loads(decode(cursor) or "")
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [datetime.fromisoformat(value) if value is not None and isinstance(column.type, DateTime) else value
+                for (column, _), value in zip(keys, values)]
+    except (TypeError, ValueError):
+        raise ValueError("游标无效")
+
+
+# 返回 (本页数据, 下一页游标)；没有下一页时游标为 None，cursor 为空串表示第一页
+def keysetPage(query, keys, cursor, pageSize):
+    query = query.order_by(None).order_by(*[column.desc() if desc else column for column, desc in keys])
+    if cursor:
+        query = query.filter(_seekFilter(keys, decodeCursor(keys, cursor)))
+    # 多取一条判断是否还有下一页
+    rows = query.limit(pageSize + 1).all()
+    if len(rows) > pageSize:
+        return rows[:pageSize], encodeCursor(keys, rows[pageSize - 1])
+    return rows, None
+
+
+# 请求里的开关参数（前端可能传 "false"、"0"、"null" 等字符串）
+def flagOf(data, key):
+    return data.get(key) not in (None, False, 0, "", "0", "false", "null")
@@ -0,0 +1,36 @@
+# 密码计算子进程用到的函数和进程类：只依赖 bcrypt 和标准库，子进程启动时不导入服务的其他模块（见 utils/passwords.py）
+import sys
+import threading
+import types
+from multiprocessing.context import ForkServerContext, ForkServerProcess
+
+from bcrypt import checkpw, gensalt, hashpw
+
+
+def hashPassword(password, rounds):
+    return hashpw(password.encode("utf-8"), gensalt(rounds=rounds)).decode("utf-8")
+
+
+def checkPassword(password, hashedPassword):
+    return checkpw(password.encode("utf-8"), hashedPassword.encode("utf-8"))
+
+
+# 子进程启动时会按父进程的主模块信息以 __mp_main__ 重新执行 app.py（导入全部蓝图、模型和配置）：
+# 启动子进程期间换成空的主模块，子进程只导入本模块
+_launchLock = threading.Lock()
+
+
+class WorkerProcess(ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        with _launchLock:
+            main = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__")
+            try:
+                return ForkServerProcess._Popen(process_obj)
+            finally:
+                sys.modules["__main__"] = main
+
+
+class WorkerContext(ForkServerContext):
+    Process = WorkerProcess
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from utils import passwordWorker
+
+# bcrypt 计算代价（2^rounds 次迭代）：每加1耗时翻倍，只影响新生成的哈希，已有密码按其自身代价校验
+BCRYPT_ROUNDS = getattr(config, "BCRYPT_ROUNDS", 12)
+# 密码哈希、校验在独立进程池中执行，计算时不持有全局解释器锁，不拖慢其他请求；为0则在当前线程直接计算
+PASSWORD_WORKERS = getattr(config, "PASSWORD_WORKERS", min(4, os.cpu_count() or 1))
+# 最多同时排队（含执行中）的任务数，超出时直接返回繁忙，避免登录高峰时请求无限堆积
+PASSWORD_QUEUE_SIZE = getattr(config, "PASSWORD_QUEUE_SIZE", 64)
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+def hashPasswordSync(password):
+    return passwordWorker.hashPassword(password, BCRYPT_ROUNDS)
+
+
+def checkPasswordSync(password, hashedPassword):
+    return passwordWorker.checkPassword(password, hashedPassword)
+
+
+_pool = None
+_poolLock = threading.Lock()
+_slots = None
+
+
+def _getPool():
+    global _pool, _slots
+    with _poolLock:
+        if _pool is None:
+            # 处理函数在数据库线程池中执行（utils.router.offload），等待计算结果期间仍占着一个线程：
+            # 排队上限不超过线程数的一半，登录高峰时其他接口始终有线程可用（调用方在等待前应先归还数据库连接）
+            # models 导入了本模块，utils.router 又依赖 models，因此在这里延迟导入
+            from utils.router import DB_THREADS
+            queueSize = min(PASSWORD_QUEUE_SIZE, max(1, DB_THREADS // 2)) if DB_THREADS else PASSWORD_QUEUE_SIZE
+            _slots = threading.BoundedSemaphore(queueSize)
+            # 服务进程中已有多个线程，用 forkserver 启动子进程，避免 fork 时复制线程持有的锁；
+            # forkserver 进程只预先导入 bcrypt，不导入主模块
+            context = passwordWorker.WorkerContext()
+            context.set_forkserver_preload(["utils.passwordWorker"])
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS, mp_context=context)
+        return _pool
+
+
+async def _submit(func, *args):
+    if not PASSWORD_WORKERS:
+        return func(*args)
+    pool = _getPool()
+    if not _slots.acquire(blocking=False):
+        raise PasswordBusy()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    finally:
+        _slots.release()
+
+
+async def hashPassword(password):
+    return await _submit(passwordWorker.hashPassword, password, BCRYPT_ROUNDS)
+
+
+async def checkPassword(password, hashedPassword):
+    return await _submit(passwordWorker.checkPassword, password, hashedPassword)
+
+
+# 服务启动时预先拉起子进程，首个登录请求不必等待进程启动
+def startPasswordPool():
+    if PASSWORD_WORKERS:
+        pool = _getPool()
+        for _ in range(PASSWORD_WORKERS):
+            pool.submit(os.getpid)
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select
+
+import config
+from models import ClientLog, Log, Session
+from utils.exporter import purgeExports
+
+# 日志保留策略：maxRows 只保留最新的若干条，maxDays 只保留最近若干天，两者都配置时满足任一即删除，不配置则不清理
+RETENTION_POLICIES = getattr(config, "RETENTION_POLICIES", {
+    "log": {"maxRows": getattr(config, "MAX_LOG_LENGTH", None)},
+    "client_log": {},
+})
+# 每批删除的行数（每批一个事务，避免长时间锁表）、两次清理的间隔（秒）
+RETENTION_BATCH_SIZE = getattr(config, "RETENTION_BATCH_SIZE", 5000)
+RETENTION_INTERVAL = getattr(config, "RETENTION_INTERVAL", 3600)
+
+_models = {"log": Log, "client_log": ClientLog}
+
+
+# 按策略得到待删除行的条件，无需清理时返回 None
+def _expiredFilter(session, model, policy):
+    conditions = []
+    if policy.get("maxRows"):
+        # 按主键倒序跳过要保留的行，取到的id及更小的都要删除
+        boundary = session.execute(
+            select(model.id).order_by(model.id.desc()).offset(policy["maxRows"]).limit(1)
+        ).scalar()
+        if boundary is not None:
+            conditions.append(model.id <= boundary)
+    if policy.get("maxDays"):
+        conditions.append(model.time < datetime.now() - timedelta(days=policy["maxDays"]))
+    return or_(*conditions) if conditions else None
+
+
+# 按id从小到大分批删除，每批先定位本批最后一行的id，再按主键范围删除；返回删除的行数
+def purgeTable(tableName, policy, batchSize=RETENTION_BATCH_SIZE):
+    model = _models[tableName]
+    deleted = 0
+    session = Session()
+    try:
+        expired = _expiredFilter(session, model, policy)
+        if expired is None:
+            return 0
+        while True:
+            lastId = session.execute(
+                select(model.id).where(expired).order_by(model.id).offset(batchSize - 1).limit(1)
+            ).scalar()
+            statement = delete(model).where(expired)
+            if lastId is not None:
+                statement = statement.where(model.id <= lastId)
+            deleted += session.execute(statement).rowcount
+            session.commit()
+            if lastId is None:
+                return deleted
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def purgeLogs():
+    return {tableName: purgeTable(tableName, policy) for tableName, policy in RETENTION_POLICIES.items()}
+
+
+async def _retentionLoop():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, purgeLogs)
+        except Exception as e:
+            print(f"日志清理失败：{e}")
+        # 过期的导出文件也在此删除，不依赖下一次导出
+        try:
+            await loop.run_in_executor(None, purgeExports)
+        except Exception as e:
+            print(f"导出文件清理失败：{e}")
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+
+_task = None
+
+
+# 启动后台定时清理（服务启动时调用）
+async def startRetention():
+    global _task
+    if _task is None and RETENTION_INTERVAL:
+        _task = asyncio.get_running_loop().create_task(_retentionLoop())
+
+
+# 手动清理：python -m utils.retention
+if __name__ == "__main__":
+    for tableName, count in purgeLogs().items():
+        print(f"{tableName}：删除{count}条")
+    print(f"导出文件：删除{purgeExports()}个")
@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from robyn import SubRouter as _SubRouter
+
+import config
+from models import engine
+from utils.metrics import instrument
+
+# 处理函数中的数据库操作都是同步阻塞的，放到线程池执行，避免一条慢查询卡住整个事件循环
+# 线程数默认与连接池大小一致（多出的线程只会排队等连接）；为0则在事件循环中直接执行
+DB_THREADS = getattr(config, "DB_THREADS", engine.pool.size() if hasattr(engine.pool, "size") else 0)
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db") if DB_THREADS else None
+# 每个工作线程一个事件循环，处理函数中的 await 在该循环中完成
+_threadLoops = threading.local()
+
+
+def _runInThread(handler, args, kwargs):
+    loop = getattr(_threadLoops, "loop", None)
+    if loop is None:
+        loop = _threadLoops.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(handler(*args, **kwargs))
+
+
+def offload(handler):
+    if _executor is None or not iscoroutinefunction(handler):
+        return handler
+
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        # 带上当前上下文（请求指标等 contextvar）
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, context.run, _runInThread, handler, args, kwargs)
+
+    return wrapper
+
+
+# 注册路由时统一包装处理函数：在线程池中执行，并记录耗时（含排队）、SQL 条数等指标
+class SubRouter(_SubRouter):
+    def add_route(self, route_type, endpoint, handler, *args, **kwargs):
+        return super().add_route(route_type, endpoint, instrument(endpoint, offload(handler)), *args, **kwargs)
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+
+import config
+from models import engine
+from utils.metrics import currentRequest
+
+# 慢查询阈值（毫秒）、记录比例（0~1，慢查询过多时可只抽样记录一部分）、是否附带执行计划
+SLOW_QUERY_MS = getattr(config, "SLOW_QUERY_MS", 200)
+SLOW_QUERY_SAMPLE_RATE = getattr(config, "SLOW_QUERY_SAMPLE_RATE", 1.0)
+SLOW_QUERY_EXPLAIN = getattr(config, "SLOW_QUERY_EXPLAIN", False)
+# 日志文件按大小滚动
+SLOW_QUERY_LOG = getattr(config, "SLOW_QUERY_LOG", "./temp/slow_query.log")
+SLOW_QUERY_LOG_BYTES = getattr(config, "SLOW_QUERY_LOG_BYTES", 10 * 1024 * 1024)
+SLOW_QUERY_LOG_BACKUPS = getattr(config, "SLOW_QUERY_LOG_BACKUPS", 5)
+
+logger = logging.getLogger("crm.slowQuery")
+logger.setLevel(logging.INFO)
+# 不向上传递，避免与 echo 等其他日志混在一起
+logger.propagate = False
+if SLOW_QUERY_MS is not None and not logger.handlers:
+    os.makedirs(os.path.dirname(SLOW_QUERY_LOG) or ".", exist_ok=True)
+    _handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                   backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8", delay=True)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+
+
+# 参数只记录类型（字符串、列表附带长度），不记录具体取值，避免日志中出现手机号、密码等敏感信息
+def _shapeOf(value):
+    if isinstance(value, (str, bytes, list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameterShape(parameters):
+    if isinstance(parameters, dict):
+        return {key: _shapeOf(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_shapeOf(value) for value in parameters]
+    return _shapeOf(parameters)
+
+
+def _explain(cursor, statement, parameters, dialectName):
+    # 只对查询语句取执行计划，避免重复执行写操作
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if dialectName == "sqlite" else "EXPLAIN "
+    explainCursor = cursor.connection.cursor()
+    try:
+        explainCursor.execute(prefix + statement, parameters)
+        columns = [column[0] for column in explainCursor.description or ()]
+        return [dict(zip(columns, row)) for row in explainCursor.fetchall()]
+    except Exception as e:
+        return f"EXPLAIN 失败：{e}"
+    finally:
+        explainCursor.close()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slowQueryStart", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("slowQueryStart")
+    if not starts:
+        return
+    elapsed = (time.perf_counter() - starts.pop()) * 1000
+    if SLOW_QUERY_MS is None or elapsed < SLOW_QUERY_MS or random.random() >= SLOW_QUERY_SAMPLE_RATE:
+        return
+    # 服务端游标（stream_results / yield_per）的结果尚未读完：rowcount 无意义（pymysql 返回 2^64-1），
+    # 也不能在同一连接上执行 EXPLAIN，否则 pymysql 会先读掉并丢弃剩余结果，导出等流式读取拿到的数据不完整
+    streamed = bool(context is not None and context.execution_options.get("stream_results"))
+    stats = currentRequest.get()
+    record = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "route": stats.route if stats is not None else None,
+        "durationMs": round(elapsed, 2),
+        "statement": re.sub(r"\s+", " ", statement).strip(),
+        # executemany 只记录第一组参数的形状及组数
+        "parameters": parameterShape(parameters[0] if executemany and parameters else parameters),
+        "executemany": len(parameters) if executemany else None,
+        "rowcount": None if streamed else cursor.rowcount,
+        "streamed": streamed,
+    }
+    if SLOW_QUERY_EXPLAIN and not executemany and not streamed:
+        record["explain"] = _explain(cursor, statement, parameters, conn.dialect.name)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))